@@ -2,10 +2,11 @@
 import torch
 import gc
 import logging
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any, Set, Tuple
 from pathlib import Path
 import asyncio
 import time
+import uuid
 from datetime import datetime
 import numpy as np
 from PIL import Image
@@ -15,6 +16,7 @@ import os
 
 # Diffusers imports
 from diffusers import (
+    AutoencoderKL,
     DiffusionPipeline,
     StableDiffusionXLPipeline,
     StableDiffusionXLImg2ImgPipeline,
@@ -30,8 +32,8 @@ from peft import PeftModel, LoraConfig, get_peft_model
 from transformers import CLIPTokenizer, CLIPTextModel
 
 from config import Settings
-from models import GenerationRequest, GeneratedAsset, ModelInfo, AssetType, StyleType
-from s3_model_manager import get_s3_model_manager
+from models import GenerationRequest, GeneratedAssetStruct, ModelInfo, AssetType, StyleType
+from s3_model_manager import close_s3_model_manager, get_s3_model_manager
 
 logger = logging.getLogger(__name__)
 
@@ -93,6 +95,9 @@ class AIPipeline:
         self.current_pipeline: Optional[DiffusionPipeline] = None
         self.current_model_id: str = ""
         
+        # Shapes the compiled UNet has specialized graphs for, across every cached model
+        self.compiled_shapes: Set[Tuple[int, int, int]] = set()
+        
         # LoRA management
         self.lora_cache: Dict[str, Any] = {}
         
@@ -165,12 +170,14 @@ class AIPipeline:
             # Determine model path
             model_path = await self._resolve_model_path(model_id)
             
-            # Load pipeline based on model type
+            # Load pipeline based on model type; low_cpu_mem_usage fills the weights straight
+            # from the mmapped safetensors instead of into a randomly initialized copy first
             if model_type == "sdxl":
                 pipeline = StableDiffusionXLPipeline.from_pretrained(
                     model_path,
                     torch_dtype=self.dtype,
                     use_safetensors=True,
+                    low_cpu_mem_usage=True,
                     variant="fp16" if self.dtype == torch.float16 else None
                 )
             else:
@@ -178,7 +185,8 @@ class AIPipeline:
                 pipeline = AutoPipelineForText2Image.from_pretrained(
                     model_path,
                     torch_dtype=self.dtype,
-                    use_safetensors=True
+                    use_safetensors=True,
+                    low_cpu_mem_usage=True
                 )
             
             # Optimize pipeline
@@ -195,6 +203,10 @@ class AIPipeline:
             if self.settings.enable_cpu_offload and self.device.type == "cuda":
                 pipeline.enable_sequential_cpu_offload()
             
+            # Apply GPU inference optimizations
+            if self.device.type == "cuda":
+                self._optimize_pipeline(pipeline)
+            
             # Set scheduler
             if self.settings.scheduler == "dpm":
                 pipeline.scheduler = DPMSolverMultistepScheduler.from_config(pipeline.scheduler.config)
@@ -210,12 +222,75 @@ class AIPipeline:
             
             load_time = time.time() - start_time
             logger.info(f"✅ Model loaded in {load_time:.2f}s: {model_id}")
+            
+            # Warm up only once the compiled UNet is on the GPU with its final VAE and
+            # scheduler, so the CUDA graphs get built rather than CPU kernels
+            if hasattr(getattr(pipeline, "unet", None), "_orig_mod") and pipeline.device.type == "cuda":
+                try:
+                    self._warmup_pipeline()
+                except Exception as e:
+                    logger.warning(f"⚠️ Warmup failed, first request will compile instead: {e}")
             return True
             
         except Exception as e:
             logger.error(f"❌ Failed to load model {model_id}: {e}")
             return False
     
+    def _optimize_pipeline(self, pipeline: DiffusionPipeline):
+        """Apply mixed precision and compilation settings to a freshly loaded pipeline"""
+        if self.settings.mixed_precision and hasattr(pipeline, "vae"):
+            # The stock SDXL VAE overflows in fp16 and gets upcast to fp32 for every decode
+            pipeline.vae = AutoencoderKL.from_pretrained(
+                self.settings.vae_model_path,
+                torch_dtype=torch.float16
+            ).to(self.device)
+        
+        if self.settings.compile_model and not self.settings.enable_cpu_offload and hasattr(pipeline, "unet"):
+            # Static shapes: one specialized graph per size instead of a slower dynamic-shape graph
+            torch._dynamo.config.cache_size_limit = max(
+                torch._dynamo.config.cache_size_limit, self.settings.max_compiled_shapes
+            )
+            pipeline.unet.to(memory_format=torch.channels_last)
+            pipeline.unet = torch.compile(pipeline.unet, mode="reduce-overhead", dynamic=False)
+            logger.info("⚡ UNet compiled with torch.compile")
+    
+    def _track_compiled_shape(self, width: int, height: int, batch_size: int):
+        """Record a generation shape, flushing every compiled graph once max_compiled_shapes is exceeded
+        
+        dynamo's cache_size_limit counts graphs per code object, and every cached
+        model's UNet shares the same forward, so shapes are counted globally rather
+        than per model. dynamo cannot drop a single graph, so overflowing resets
+        all of them and the shapes still in use recompile on next use.
+        """
+        if not hasattr(self.current_pipeline.unet, "_orig_mod"):
+            return
+        
+        key = (width, height, batch_size)
+        if key in self.compiled_shapes:
+            return
+        
+        if len(self.compiled_shapes) >= self.settings.max_compiled_shapes:
+            logger.warning(f"♻️ {len(self.compiled_shapes)} compiled shapes, resetting compiled graphs")
+            torch._dynamo.reset()
+            self.compiled_shapes.clear()
+        
+        logger.info(f"⚡ Compiling UNet for {width}x{height} (batch {batch_size})")
+        self.compiled_shapes.add(key)
+    
+    def _warmup_pipeline(self):
+        """Run one small generation so the first request does not pay the compile cost"""
+        logger.info("🔥 Warming up compiled pipeline...")
+        start_time = time.time()
+        self._track_compiled_shape(self.settings.default_width, self.settings.default_height, 1)
+        self.current_pipeline(
+            prompt="warmup",
+            num_inference_steps=2,
+            width=self.settings.default_width,
+            height=self.settings.default_height,
+            output_type="latent"
+        )
+        logger.info(f"✅ Warmup finished in {time.time() - start_time:.2f}s")
+    
     async def load_lora(self, lora_path: str, scale: float = 1.0) -> bool:
         """Load LoRA weights"""
         try:
@@ -251,7 +326,7 @@ class AIPipeline:
             logger.error(f"❌ Failed to load LoRA {lora_path}: {e}")
             return False
     
-    async def generate_assets(self, request: GenerationRequest) -> List[GeneratedAsset]:
+    async def generate_assets(self, request: GenerationRequest) -> List[GeneratedAssetStruct]:
         """Generate assets based on request"""
         try:
             if not self.current_pipeline:
@@ -275,6 +350,7 @@ class AIPipeline:
                 generator = torch.Generator(device=self.device).manual_seed(request.seed)
             
             # Generate images
+            self._track_compiled_shape(request.width, request.height, request.num_images)
             results = self.current_pipeline(
                 prompt=enhanced_prompt,
                 negative_prompt=request.negative_prompt,
@@ -290,37 +366,7 @@ class AIPipeline:
             # Process results
             assets = []
             for i, image in enumerate(results.images):
-                # Apply post-processing
-                processed_image = await self._post_process_image(image, request)
-                
-                # Create asset info
-                asset = GeneratedAsset(
-                    url="",  # Will be set by storage manager
-                    thumbnail_url="",
-                    filename=f"asset_{request.request_id}_{i}.{request.format.value}",
-                    width=processed_image.width,
-                    height=processed_image.height,
-                    format=request.format.value,
-                    file_size=0,  # Will be calculated after saving
-                    prompt=enhanced_prompt,
-                    negative_prompt=request.negative_prompt,
-                    seed=request.seed if request.seed else 0,
-                    steps=request.steps,
-                    guidance_scale=request.guidance_scale,
-                    model_used=self.current_model_id,
-                    quality_score=0.8,  # Placeholder quality score
-                    processing_time=time.time() - start_time,
-                    metadata={
-                        "asset_type": request.asset_type.value,
-                        "style": request.style.value if request.style else None,
-                        "quality": request.quality.value,
-                        "original_prompt": request.prompt
-                    }
-                )
-                
-                # Store the processed image for saving
-                setattr(asset, 'processed_image', processed_image)
-                assets.append(asset)
+                assets.append(await self._build_asset(request, enhanced_prompt, image, i, start_time))
             
             generation_time = time.time() - start_time
             self.generation_count += request.num_images
@@ -333,6 +379,107 @@ class AIPipeline:
             logger.error(f"❌ Asset generation failed: {e}")
             raise
     
+    async def generate_batch(self, requests: List[GenerationRequest]) -> List[List[GeneratedAssetStruct]]:
+        """Generate one image for each request in a single pipeline call
+        
+        Requests must share width, height, steps and guidance scale, need no
+        LoRA weights and all either set or omit negative_prompt (see
+        GenerationBatcher). Returns the assets for each request in order.
+        """
+        try:
+            if not self.current_pipeline:
+                raise ValueError("No model loaded")
+            
+            first = requests[0]
+            logger.info(f"🎨 Generating batch of {len(requests)} assets")
+            start_time = time.time()
+            
+            enhanced_prompts = [self._enhance_prompt(request) for request in requests]
+            negative_prompts = None
+            if first.negative_prompt is not None:
+                negative_prompts = [request.negative_prompt for request in requests]
+            
+            # One generator per request so seeded requests stay reproducible
+            generators = []
+            for request in requests:
+                generator = torch.Generator(device=self.device)
+                if request.seed is not None:
+                    generator.manual_seed(request.seed)
+                else:
+                    generator.seed()
+                generators.append(generator)
+            
+            self._track_compiled_shape(first.width, first.height, len(requests))
+            results = self.current_pipeline(
+                prompt=enhanced_prompts,
+                negative_prompt=negative_prompts,
+                num_images_per_prompt=1,
+                num_inference_steps=first.steps,
+                guidance_scale=first.guidance_scale,
+                width=first.width,
+                height=first.height,
+                generator=generators,
+                output_type="pil"
+            )
+            
+            batch_assets = []
+            for request, prompt, image in zip(requests, enhanced_prompts, results.images):
+                batch_assets.append([await self._build_asset(request, prompt, image, 0, start_time)])
+            
+            generation_time = time.time() - start_time
+            self.generation_count += len(requests)
+            self.total_time += generation_time
+            
+            logger.info(f"✅ Generated batch of {len(requests)} assets in {generation_time:.2f}s")
+            return batch_assets
+            
+        except Exception as e:
+            logger.error(f"❌ Batch generation failed: {e}")
+            raise
+    
+    async def _build_asset(
+        self,
+        request: GenerationRequest,
+        enhanced_prompt: str,
+        image: Image.Image,
+        index: int,
+        start_time: float
+    ) -> GeneratedAssetStruct:
+        """Post-process a generated image and wrap it in asset info"""
+        # Apply post-processing
+        processed_image = await self._post_process_image(image, request)
+        
+        # Create asset info (server-built, so skip validation)
+        asset = GeneratedAssetStruct(
+            id=str(uuid.uuid4()),
+            url="",  # Will be set by storage manager
+            thumbnail_url="",
+            filename=f"asset_{request.request_id}_{index}.{request.format}",
+            width=processed_image.width,
+            height=processed_image.height,
+            format=request.format,
+            file_size=0,  # Will be calculated after saving
+            prompt=enhanced_prompt,
+            negative_prompt=request.negative_prompt,
+            seed=request.seed if request.seed else 0,
+            steps=request.steps,
+            guidance_scale=request.guidance_scale,
+            model_used=self.current_model_id,
+            quality_score=0.8,  # Placeholder quality score
+            processing_time=time.time() - start_time,
+            created_at=datetime.now(),
+            metadata={
+                "asset_type": request.asset_type,
+                "style": request.style,
+                "quality": request.quality,
+                "original_prompt": request.prompt
+            }
+        )
+        
+        # Store the processed image for saving
+        setattr(asset, 'processed_image', processed_image)
+        return asset
+    
     def _enhance_prompt(self, request: GenerationRequest) -> str:
         """Enhance prompt based on asset type and style"""
         prompt = request.prompt
@@ -360,7 +507,7 @@ class AIPipeline:
             prompt += ", UI element, interface design, clean graphics"
         
         # Add quality enhancements
-        if request.quality.value in ["high", "production"]:
+        if request.quality in ["high", "production"]:
             prompt += ", high quality, detailed, professional"
         
         # Add transparency hint if requested
@@ -387,9 +534,9 @@ class AIPipeline:
                 processed = await self._optimize_for_tileset(processed)
             
             # Convert format if needed
-            if request.format.value == "png" and processed.mode != "RGBA":
+            if request.format == "png" and processed.mode != "RGBA":
                 processed = processed.convert("RGBA")
-            elif request.format.value in ["jpg", "jpeg"] and processed.mode != "RGB":
+            elif request.format in ["jpg", "jpeg"] and processed.mode != "RGB":
                 processed = processed.convert("RGB")
             
             return processed
@@ -511,6 +658,7 @@ class AIPipeline:
         self.model_cache.clear()
         self.lora_cache.clear()
         self.current_pipeline = None
+        await close_s3_model_manager()
         
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
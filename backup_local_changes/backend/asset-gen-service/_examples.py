@@ -0,0 +1,41 @@
+"""
+OpenAPI examples for the asset generation models
+
+Imported lazily by models.add_schema_example the first time a schema is
+generated, so workers that never serve /docs skip building these dicts.
+"""
+
+EXAMPLES = {
+    "AssetGenerationRequest": {
+        "prompt": "medieval sword with blue gems, fantasy game weapon",
+        "negative_prompt": "blurry, low quality, modern",
+        "asset_type": "sprite",
+        "width": 256,
+        "height": 256,
+        "num_variants": 4,
+        "project_id": "proj_123",
+        "user_id": "user_456",
+        "tags": ["weapon", "medieval", "blue"]
+    },
+    "AssetGenerationResponse": {
+        "asset_id": "asset_789",
+        "request_id": "req_123",
+        "status": "completed",
+        "images": ["base64_encoded_image_1", "base64_encoded_image_2"],
+        "metadata": {
+            "prompt": "medieval sword",
+            "generation_params": {"width": 256, "height": 256}
+        },
+        "created_at": "2025-09-02T16:30:00Z",
+        "generation_time": 15.7
+    },
+    "StylePackInfo": {
+        "style_pack_id": "pack_pixel_art",
+        "name": "16-bit Pixel Art",
+        "description": "Classic retro pixel art style",
+        "model_path": "/models/pixel_art_lora.safetensors",
+        "trigger_words": ["pixel art", "16bit", "retro"],
+        "training_images_count": 150,
+        "quality_score": 0.87
+    }
+}
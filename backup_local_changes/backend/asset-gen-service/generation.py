@@ -36,6 +36,14 @@ class AssetGenerationService:
         self.total_generations = 0
         self.successful_generations = 0
         
+        # Asset-type specific post-processing, keyed by enum member
+        self.post_processors = {
+            AssetType.SPRITE: self._process_sprite,
+            AssetType.TILESET: self._process_tileset,
+            AssetType.UI_ELEMENT: self._process_ui_element,
+            AssetType.ICON: self._process_icon,
+        }
+        
     async def initialize(self):
         """Initialize all AI models and pipelines"""
         if self.is_initialized:
@@ -128,7 +136,11 @@ class AssetGenerationService:
         request: AssetGenerationRequest,
         progress_callback: Optional[callable] = None
     ) -> AssetGenerationResponse:
-        """Generate asset from request"""
+        """Generate asset from request
+        
+        progress_callback, if given, is awaited with each update already
+        encoded as ProgressUpdate JSON bytes, ready to publish.
+        """
         start_time = datetime.utcnow()
         request_id = str(uuid.uuid4())
         
@@ -137,7 +149,7 @@ class AssetGenerationService:
             
             # Progress: Starting
             if progress_callback:
-                await progress_callback(ProgressUpdate(
+                await progress_callback(ProgressUpdate.to_bytes(
                     request_id=request_id,
                     status=GenerationStatus.PROCESSING,
                     progress=0.0,
@@ -154,7 +166,7 @@ class AssetGenerationService:
             images = []
             for i in range(request.num_variants):
                 if progress_callback:
-                    await progress_callback(ProgressUpdate(
+                    await progress_callback(ProgressUpdate.to_bytes(
                         request_id=request_id,
                         status=GenerationStatus.PROCESSING,
                         progress=(i / request.num_variants) * 0.8,
@@ -175,7 +187,7 @@ class AssetGenerationService:
             
             # Final processing
             if progress_callback:
-                await progress_callback(ProgressUpdate(
+                await progress_callback(ProgressUpdate.to_bytes(
                     request_id=request_id,
                     status=GenerationStatus.POST_PROCESSING,
                     progress=0.9,
@@ -193,7 +205,7 @@ class AssetGenerationService:
             generation_time = (end_time - start_time).total_seconds()
             
             if progress_callback:
-                await progress_callback(ProgressUpdate(
+                await progress_callback(ProgressUpdate.to_bytes(
                     request_id=request_id,
                     status=GenerationStatus.COMPLETED,
                     progress=1.0,
@@ -229,7 +241,7 @@ class AssetGenerationService:
             
         except Exception as e:
             if progress_callback:
-                await progress_callback(ProgressUpdate(
+                await progress_callback(ProgressUpdate.to_bytes(
                     request_id=request_id,
                     status=GenerationStatus.FAILED,
                     progress=0.0,
@@ -296,16 +308,10 @@ class AssetGenerationService:
     
     async def _post_process_image(self, image: Image.Image, asset_type: AssetType) -> Image.Image:
         """Apply asset-type specific post-processing"""
-        if asset_type == AssetType.SPRITE:
-            return await self._process_sprite(image)
-        elif asset_type == AssetType.TILESET:
-            return await self._process_tileset(image)
-        elif asset_type == AssetType.UI_ELEMENT:
-            return await self._process_ui_element(image)
-        elif asset_type == AssetType.ICON:
-            return await self._process_icon(image)
-        else:
+        processor = self.post_processors.get(asset_type)
+        if processor is None:
             return image
+        return await processor(image)
     
     async def _process_sprite(self, image: Image.Image) -> Image.Image:
         """Process sprite - remove background, ensure proper alpha"""
@@ -11,6 +11,7 @@ import uvicorn
 from fastapi import FastAPI, BackgroundTasks, HTTPException, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
+import msgspec
 import redis.asyncio as redis
 import torch
 from diffusers import StableDiffusionXLPipeline, DiffusionPipeline
@@ -54,7 +55,7 @@ class AssetResponse(BaseModel):
     metadata: Dict[str, Any]
     created_at: datetime
 
-class ProgressUpdate(BaseModel):
+class ProgressUpdate(msgspec.Struct, gc=False):
     request_id: str
     status: str  # queued, processing, post_processing, completed, failed
     progress: float  # 0.0 to 1.0
@@ -133,12 +134,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+progress_encoder = msgspec.json.Encoder()
+
 async def publish_progress(update: ProgressUpdate):
     """Publish progress update to Redis for WebSocket broadcast"""
     try:
         await redis_client.publish(
             f"asset_progress:{update.request_id}",
-            update.json()
+            progress_encoder.encode(update)
         )
     except Exception as e:
         print(f"Error publishing progress: {e}")
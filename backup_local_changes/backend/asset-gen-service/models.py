@@ -1,10 +1,21 @@
+# cython: binding=True
 """
 Asset Generation Models and Data Structures
+
+Can be compiled to a C extension with `python setup.py build_ext --inplace`;
+binding=True keeps the function signatures pydantic introspects.
 """
+import importlib
+import time
 from typing import List, Optional, Dict, Any, Union
-from pydantic import BaseModel, Field, validator
-from datetime import datetime
+from pydantic import BaseModel, Field, computed_field, conlist, constr, model_validator
+from datetime import datetime, timedelta, timezone
 from enum import Enum
+import msgspec
+
+def add_schema_example(schema: Dict[str, Any], model: type) -> None:
+    """Attach the /docs example for a model, loading the examples on first use"""
+    schema["example"] = importlib.import_module("_examples").EXAMPLES[model.__name__]
 
 class AssetType(str, Enum):
     SPRITE = "sprite"
@@ -53,19 +64,7 @@ class AssetGenerationRequest(BaseModel):
     post_process: bool = Field(default=True, description="Apply asset-type specific post-processing")
     
     class Config:
-        schema_extra = {
-            "example": {
-                "prompt": "medieval sword with blue gems, fantasy game weapon",
-                "negative_prompt": "blurry, low quality, modern",
-                "asset_type": "sprite",
-                "width": 256,
-                "height": 256,
-                "num_variants": 4,
-                "project_id": "proj_123",
-                "user_id": "user_456",
-                "tags": ["weapon", "medieval", "blue"]
-            }
-        }
+        json_schema_extra = add_schema_example
 
 class AssetGenerationResponse(BaseModel):
     """Response model for asset generation"""
@@ -83,35 +82,33 @@ class AssetGenerationResponse(BaseModel):
     quality_scores: Optional[Dict[str, float]] = Field(default=None)
     
     class Config:
-        schema_extra = {
-            "example": {
-                "asset_id": "asset_789",
-                "request_id": "req_123",
-                "status": "completed",
-                "images": ["base64_encoded_image_1", "base64_encoded_image_2"],
-                "metadata": {
-                    "prompt": "medieval sword",
-                    "generation_params": {"width": 256, "height": 256}
-                },
-                "created_at": "2025-09-02T16:30:00Z",
-                "generation_time": 15.7
-            }
-        }
+        json_schema_extra = add_schema_example
 
-class ProgressUpdate(BaseModel):
-    """Real-time progress update"""
+class ProgressUpdate(msgspec.Struct, gc=False):
+    """Real-time progress update
+    
+    A msgspec Struct rather than a pydantic model: updates are built by the
+    server on every inference step and only ever encoded, never validated.
+    """
     request_id: str
     status: GenerationStatus
-    progress: float = Field(ge=0.0, le=1.0, description="Progress from 0 to 1")
+    progress: float  # Progress from 0 to 1
     current_step: str
-    step_number: int = Field(default=0, description="Current step number")
-    total_steps: int = Field(default=0, description="Total steps")
-    estimated_time_remaining: Optional[int] = Field(default=None, description="ETA in seconds")
+    step_number: int = 0  # Current step number
+    total_steps: int = 0  # Total steps
+    estimated_time_remaining: Optional[int] = None  # ETA in seconds
     error_message: Optional[str] = None
     
     # Performance metrics
-    gpu_memory_used: Optional[float] = Field(default=None, description="GPU memory in GB")
-    generation_speed: Optional[float] = Field(default=None, description="Steps per second")
+    gpu_memory_used: Optional[float] = None  # GPU memory in GB
+    generation_speed: Optional[float] = None  # Steps per second
+    
+    @classmethod
+    def to_bytes(cls, **fields: Any) -> bytes:
+        """Build an update and encode it straight to JSON bytes, ready to publish to Redis"""
+        return _progress_encoder.encode(cls(**fields))
+
+_progress_encoder = msgspec.json.Encoder()
 
 class StylePackInfo(BaseModel):
     """Style pack information"""
@@ -132,30 +129,36 @@ class StylePackInfo(BaseModel):
     last_used: Optional[datetime] = None
     
     class Config:
-        schema_extra = {
-            "example": {
-                "style_pack_id": "pack_pixel_art",
-                "name": "16-bit Pixel Art",
-                "description": "Classic retro pixel art style",
-                "model_path": "/models/pixel_art_lora.safetensors",
-                "trigger_words": ["pixel art", "16bit", "retro"],
-                "training_images_count": 150,
-                "quality_score": 0.87
-            }
-        }
+        json_schema_extra = add_schema_example
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def parse_created_at(cls, values):
+    """Accept a legacy created_at datetime/ISO string as input, stored as created_at_ns"""
+    if not isinstance(values, dict) or 'created_at' not in values:
+        return values
+    values = dict(values)
+    created_at = values.pop('created_at')
+    if created_at is not None and 'created_at_ns' not in values:
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        # Integer arithmetic: a float timestamp cannot hold microseconds exactly
+        values['created_at_ns'] = (created_at - _EPOCH) // timedelta(microseconds=1) * 1000
+    return values
 
 class BatchRequest(BaseModel):
     """Batch asset generation request"""
     batch_id: str
     name: str
     description: Optional[str] = None
-    prompts: List[str] = Field(..., description="List of prompts for batch generation")
+    prompts: conlist(
+        constr(strip_whitespace=True, min_length=1, max_length=2000), min_length=1, max_length=100
+    ) = Field(..., description="List of prompts for batch generation")
     
-    @validator('prompts')
-    def validate_prompts(cls, v):
-        if len(v) < 1 or len(v) > 100:
-            raise ValueError('prompts must contain between 1 and 100 items')
-        return v
+    # Module-level function so Cython does not compile it as a class closure
+    set_created_at = model_validator(mode="before")(parse_created_at)
     
     # Common parameters for all assets in batch
     base_params: AssetGenerationRequest
@@ -167,7 +170,7 @@ class BatchRequest(BaseModel):
     
     # Status
     status: GenerationStatus = GenerationStatus.QUEUED
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at_ns: int = Field(default_factory=time.time_ns, exclude=True)
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
     
@@ -175,6 +178,14 @@ class BatchRequest(BaseModel):
     total_assets: int = 0
     completed_assets: int = 0
     failed_assets: int = 0
+    
+    @computed_field
+    @property
+    def created_at(self) -> datetime:
+        """Creation time (naive UTC), built from created_at_ns only when read or serialized"""
+        # Integer microseconds, not created_at_ns / 1e9: a float loses the sub-microsecond digits
+        # and can round the microseconds
+        return (_EPOCH + timedelta(microseconds=self.created_at_ns // 1000)).replace(tzinfo=None)
 
 class AssetMetadata(BaseModel):
     """Extended asset metadata"""
@@ -182,7 +193,7 @@ class AssetMetadata(BaseModel):
     filename: str
     file_size: int
     mime_type: str
-    dimensions: tuple[int, int]
+    dimensions: conlist(int, min_length=2, max_length=2)  # (width, height)
     
     # Generation info
     prompt: str
@@ -223,7 +234,7 @@ class GenerationConfig(BaseModel):
     # Storage settings
     output_format: str = "PNG"
     compression_quality: int = 95
-    thumbnail_size: tuple[int, int] = (256, 256)
+    thumbnail_size: conlist(int, min_length=2, max_length=2) = [256, 256]
     
     # Cache settings
     cache_models: bool = True
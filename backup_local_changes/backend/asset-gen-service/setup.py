@@ -0,0 +1,19 @@
+"""
+Compile models.py into a C extension with Cython
+
+    python setup.py build_ext --inplace
+
+Python imports the resulting models.cpython-*.so ahead of models.py; without
+it the pure-Python module is used unchanged.
+"""
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name="asset-gen-models",
+    ext_modules=cythonize(
+        ["models.py"],
+        language_level=3,
+        compiler_directives={"boundscheck": False, "wraparound": False}
+    )
+)
@@ -0,0 +1,145 @@
+# Request Batcher - Coalesces concurrent generation requests into one pipeline call
+import asyncio
+import contextlib
+import logging
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    # Annotations only, so AsyncBatcher can be imported without the torch pipeline
+    from models import GenerationRequest, GeneratedAssetStruct
+    from ai_pipeline import AIPipeline
+
+logger = logging.getLogger(__name__)
+
+class AsyncBatcher(ABC):
+    """Collects items for up to max_wait_ms and hands them to process_batch together
+
+    When semaphore is set, each batch holds one slot of it while it runs, so
+    batches share a concurrency limit with other work (e.g. the job workers).
+    """
+
+    def __init__(self, max_batch_size: int = 4, max_wait_ms: int = 50,
+                 semaphore: Optional[asyncio.Semaphore] = None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.semaphore = semaphore
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self._batch: List[Tuple[Any, asyncio.Future]] = []  # Batch being gathered or processed
+
+    async def start(self):
+        """Start the batching loop"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop and fail every item still waiting, queued or mid-batch"""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+        pending, self._batch = self._batch, []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def process(self, item: Any) -> Any:
+        """Submit one item and wait for its result from the next batch"""
+        if self.task is None:
+            raise RuntimeError("Batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    @abstractmethod
+    async def process_batch(self, items: List[Any]) -> List[Any]:
+        """Process a batch of items, returning one result (or exception) per item in order"""
+
+    async def _run(self):
+        """Gather a batch (first item plus whatever arrives within max_wait) and process it"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            self._batch = batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                async with self.semaphore or contextlib.nullcontext():
+                    results = await self.process_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._batch = []
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            self._batch = []
+
+class GenerationBatcher(AsyncBatcher):
+    """Batches single-image generation requests into shared SDXL forward passes"""
+
+    def __init__(self, ai_pipeline: "AIPipeline", max_batch_size: int = 4, max_wait_ms: int = 50):
+        super().__init__(max_batch_size, max_wait_ms)
+        self.ai_pipeline = ai_pipeline
+
+    def accepts(self, request: "GenerationRequest") -> bool:
+        """Whether a request can share a pipeline call with others"""
+        return (
+            request.num_images == 1
+            and not request.lora_weights
+            and (not request.model_id or request.model_id == self.ai_pipeline.current_model_id)
+        )
+
+    @staticmethod
+    def _bucket(request: "GenerationRequest") -> Tuple:
+        """Requests in the same bucket can run in one pipeline call"""
+        return (
+            request.width,
+            request.height,
+            request.steps,
+            request.guidance_scale,
+            request.negative_prompt is None
+        )
+
+    async def process_batch(self, items: List["GenerationRequest"]) -> List[List["GeneratedAssetStruct"]]:
+        """Split the batch into shape buckets and run one pipeline call per bucket"""
+        buckets: Dict[Tuple, List[int]] = {}
+        for index, request in enumerate(items):
+            buckets.setdefault(self._bucket(request), []).append(index)
+
+        results: List[Any] = [None] * len(items)
+        for indices in buckets.values():
+            requests = [items[i] for i in indices]
+            try:
+                if len(requests) == 1:
+                    assets = [await self.ai_pipeline.generate_assets(requests[0])]
+                else:
+                    logger.info(f"📦 Batching {len(requests)} generation requests")
+                    assets = await self.ai_pipeline.generate_batch(requests)
+            except Exception as e:
+                assets = [e] * len(requests)
+            for i, request_assets in zip(indices, assets):
+                results[i] = request_assets
+
+        return results
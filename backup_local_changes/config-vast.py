@@ -3,7 +3,8 @@
 
 import os
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from functools import lru_cache
+from typing import Tuple, Optional
 
 class Settings(BaseSettings):
     # Service Configuration
@@ -28,6 +29,7 @@ class Settings(BaseSettings):
     default_steps: int = 20
     default_guidance_scale: float = 7.5
     max_batch_size: int = 6  # Increased for 4090's 24GB VRAM
+    batch_max_wait_ms: int = 50  # How long /generate waits to coalesce concurrent requests
     
     # Model Management - RTX 4090 Optimized
     max_cached_models: int = 3  # Can cache more models with 24GB VRAM
@@ -38,6 +40,9 @@ class Settings(BaseSettings):
     enable_attention_slicing: bool = False  # Disable for better performance on 4090
     enable_cpu_offload: bool = False        # Keep everything on GPU for speed
     use_safetensors: bool = True
+    mixed_precision: bool = True  # Use the fp16-safe VAE so decoding stays in half precision
+    compile_model: bool = True    # torch.compile the UNet; warmed up at startup
+    max_compiled_shapes: int = 8  # Output sizes kept as specialized compiled graphs
     
     # Storage Configuration
     output_dir: str = "/app/outputs"
@@ -68,16 +73,20 @@ class Settings(BaseSettings):
     
     # Security
     api_key: Optional[str] = None
-    allowed_hosts: List[str] = ["*"]  # Open for development
+    allowed_hosts: Tuple[str, ...] = ("*",)  # Open for development
     
     class Config:
         env_file = ".env"
         env_prefix = "ASSET_GEN_"
+        frozen = True  # Shared via get_settings(), so never mutated after load
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Load settings from the environment once and reuse the instance"""
+    return Settings()
 
 # Performance optimizations for RTX 4090
 RTX_4090_OPTIMIZATIONS = {
     "memory_fraction": 0.95,  # Use 95% of VRAM (22.8GB out of 24GB)
-    "mixed_precision": True,   # Enable mixed precision for better performance
-    "compile_model": True,     # Use torch.compile for faster inference
     "batch_scheduling": True,  # Enable batch scheduling for multiple requests
 }
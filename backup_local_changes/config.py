@@ -1,7 +1,8 @@
 # Environment Configuration for Asset Generation Service
 import os
 from pydantic_settings import BaseSettings
-from typing import Optional, List
+from functools import lru_cache
+from typing import Optional, Tuple
 
 class Settings(BaseSettings):
     # Service Configuration
@@ -26,6 +27,7 @@ class Settings(BaseSettings):
     default_steps: int = 20
     default_guidance_scale: float = 7.5
     max_batch_size: int = 4
+    batch_max_wait_ms: int = 50  # How long /generate waits to coalesce concurrent requests
     max_cached_models: int = 2
     scheduler: str = "dpm"  # dpm, euler_a, ddim
     
@@ -34,6 +36,9 @@ class Settings(BaseSettings):
     enable_attention_slicing: bool = True
     enable_cpu_offload: bool = True
     use_safetensors: bool = True
+    mixed_precision: bool = False  # Swap in the fp16-safe VAE from vae_model_path
+    compile_model: bool = False    # torch.compile the UNet (GPU only, slow first load)
+    max_compiled_shapes: int = 8  # Output sizes kept as specialized compiled graphs
     
     # Storage Configuration
     output_dir: str = "./outputs"
@@ -57,11 +62,17 @@ class Settings(BaseSettings):
     
     # Security
     api_key: Optional[str] = None
-    allowed_hosts: List[str] = ["localhost", "127.0.0.1"]
+    allowed_hosts: Tuple[str, ...] = ("localhost", "127.0.0.1")
     
     class Config:
         env_file = ".env"
         env_prefix = "ASSET_GEN_"
+        frozen = True  # Shared via get_settings(), so never mutated after load
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Load settings from the environment once and reuse the instance"""
+    return Settings()
 
 # Global settings instance
-settings = Settings()
+settings = get_settings()
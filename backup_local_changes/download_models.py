@@ -1,30 +1,58 @@
 import os
 import json
-from huggingface_hub import snapshot_download
+import importlib.util
 import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# hf_transfer pulls each file over parallel connections; must be enabled before huggingface_hub is imported
+if importlib.util.find_spec("hf_transfer"):
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+
+from huggingface_hub import snapshot_download
+
+# Base model plus the refiner and VAE referenced in config-vast.py
+SDXL_MODELS = [
+    "stabilityai/stable-diffusion-xl-base-1.0",
+    "stabilityai/stable-diffusion-xl-refiner-1.0",
+    "madebyollin/sdxl-vae-fp16-fix",
+]
+
+# Skip the .bin/.ckpt duplicates that SDXL repos ship alongside safetensors
+ALLOW_PATTERNS = ["*.safetensors", "*.json", "*.txt"]
 
-def download_sdxl_model(cache_dir="./models"):
-    """Download SDXL model from HuggingFace"""
-    model_id = "stabilityai/stable-diffusion-xl-base-1.0"
-    
+def download_sdxl_model(cache_dir="./models", model_id="stabilityai/stable-diffusion-xl-base-1.0"):
+    """Download SDXL model from HuggingFace; returns None if the download failed"""
     print(f"📥 Downloading {model_id}...")
     print("This will take 20-30 minutes depending on your internet connection...")
-    
+
     try:
         # Download the model
         model_path = snapshot_download(
             repo_id=model_id,
             cache_dir=cache_dir,
-            local_dir=os.path.join(cache_dir, "stable-diffusion-xl-base-1.0"),
-            local_dir_use_symlinks=False
+            local_dir=os.path.join(cache_dir, model_id.split("/")[-1]),
+            local_dir_use_symlinks=False,
+            allow_patterns=ALLOW_PATTERNS,
+            max_workers=16,
+            etag_timeout=30
         )
-        
+
         print(f"✅ Model downloaded to: {model_path}")
         return model_path
-    
+
     except Exception as e:
-        print(f"❌ Download failed: {e}")
+        print(f"❌ Download of {model_id} failed: {e}")
+        return None
+
+def download_all_models(cache_dir="./models"):
+    """Download the base model, refiner and VAE concurrently, exiting if any of them failed"""
+    with ThreadPoolExecutor(max_workers=len(SDXL_MODELS)) as executor:
+        model_paths = list(executor.map(lambda model_id: download_sdxl_model(cache_dir, model_id), SDXL_MODELS))
+
+    # Exit from the main thread: sys.exit in a worker thread only ends that thread
+    if None in model_paths:
         sys.exit(1)
+    return model_paths
 
 if __name__ == "__main__":
-    download_sdxl_model()
+    download_all_models()
@@ -3,16 +3,18 @@ import asyncio
 import logging
 import json
 import uuid
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union
 from datetime import datetime, timedelta
+import msgspec
 import redis.asyncio as redis
 
 from config import Settings
 from models import (
     GenerationRequest, StylePackRequest, JobInfo, JobStatus, JobProgress,
-    GenerationResponse, StylePackResponse, GeneratedAsset
+    GenerationResponseStruct, StylePackResponse
 )
 from ai_pipeline import AIPipeline
+from batcher import GenerationBatcher
 from storage import StorageManager
 
 logger = logging.getLogger(__name__)
@@ -20,17 +22,29 @@ logger = logging.getLogger(__name__)
 class JobProcessor:
     """Handles async job processing for asset generation and training"""
     
-    def __init__(self, ai_pipeline: AIPipeline, storage_manager: StorageManager, redis_client: redis.Redis):
+    def __init__(
+        self,
+        ai_pipeline: AIPipeline,
+        storage_manager: StorageManager,
+        redis_client: redis.Redis,
+        batcher: Optional[GenerationBatcher] = None
+    ):
         self.ai_pipeline = ai_pipeline
         self.storage_manager = storage_manager
         self.redis_client = redis_client
+        self.batcher = batcher
         
         # Job tracking
         self.active_jobs: Dict[str, asyncio.Task] = {}
         self.job_queue = asyncio.Queue()
+        self.batched_jobs: set = set()  # Keeps batcher-routed job tasks referenced
         
         # Worker settings
         self.max_concurrent_jobs = 2  # Limit concurrent GPU operations
+        # GPU slots shared by queued jobs and batcher batches (batched jobs skip the workers)
+        self.gpu_semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+        if batcher:
+            batcher.semaphore = self.gpu_semaphore
         self.workers: List[asyncio.Task] = []
         self.running = False
         
@@ -89,36 +103,10 @@ class JobProcessor:
                     # Get job from queue (wait max 1 second)
                     job_data = await asyncio.wait_for(self.job_queue.get(), timeout=1.0)
                     
-                    job_id = job_data["job_id"]
-                    job_type = job_data["type"]
-                    
-                    logger.info(f"🎯 Worker {worker_name} processing job {job_id} ({job_type})")
-                    
-                    # Update job status
-                    await self._update_job_status(job_id, JobStatus.PROCESSING)
-                    
                     try:
-                        # Process based on job type
-                        if job_type == "generation":
-                            await self._process_generation_job(job_id, job_data["request"])
-                        elif job_type == "training":
-                            await self._process_training_job(job_id, job_data["request"])
-                        else:
-                            raise ValueError(f"Unknown job type: {job_type}")
-                        
-                        # Mark as completed
-                        await self._update_job_status(job_id, JobStatus.COMPLETED)
-                        logger.info(f"✅ Job {job_id} completed by {worker_name}")
-                        
-                    except Exception as e:
-                        logger.error(f"❌ Job {job_id} failed: {e}")
-                        await self._update_job_status(job_id, JobStatus.FAILED, error=str(e))
-                    
+                        async with self.gpu_semaphore:
+                            await self._execute_job(worker_name, job_data)
                     finally:
-                        # Remove from active jobs
-                        if job_id in self.active_jobs:
-                            del self.active_jobs[job_id]
-                        
                         # Mark queue task as done
                         self.job_queue.task_done()
                         
@@ -136,6 +124,38 @@ class JobProcessor:
         
         logger.info(f"👋 Worker {worker_name} stopped")
     
+    async def _execute_job(self, worker_name: str, job_data: Dict[str, Any]):
+        """Run a single job and record its outcome"""
+        job_id = job_data["job_id"]
+        job_type = job_data["type"]
+        
+        logger.info(f"🎯 Worker {worker_name} processing job {job_id} ({job_type})")
+        
+        # Update job status
+        await self._update_job_status(job_id, JobStatus.PROCESSING)
+        
+        try:
+            # Process based on job type
+            if job_type == "generation":
+                await self._process_generation_job(job_id, job_data["request"])
+            elif job_type == "training":
+                await self._process_training_job(job_id, job_data["request"])
+            else:
+                raise ValueError(f"Unknown job type: {job_type}")
+            
+            # Mark as completed
+            await self._update_job_status(job_id, JobStatus.COMPLETED)
+            logger.info(f"✅ Job {job_id} completed by {worker_name}")
+            
+        except Exception as e:
+            logger.error(f"❌ Job {job_id} failed: {e}")
+            await self._update_job_status(job_id, JobStatus.FAILED, error=str(e))
+        
+        finally:
+            # Remove from active jobs
+            if job_id in self.active_jobs:
+                del self.active_jobs[job_id]
+    
     async def submit_generation_job(self, request: GenerationRequest) -> str:
         """Submit asset generation job"""
         job_id = str(uuid.uuid4())
@@ -149,19 +169,26 @@ class JobProcessor:
         
         await self._store_job_info(job_id, job_info)
         
-        # Add to processing queue
         job_data = {
             "job_id": job_id,
             "type": "generation",
             "request": request
         }
         
-        await self.job_queue.put(job_data)
-        
         # Track active job
         task = asyncio.create_task(self._track_job(job_id))
         self.active_jobs[job_id] = task
         
+        if self.batcher and self.batcher.accepts(request):
+            # Batchable jobs skip the worker queue so concurrent requests can
+            # meet in the batcher; each batch takes a GPU slot itself
+            batched = asyncio.create_task(self._execute_job("batcher", job_data))
+            self.batched_jobs.add(batched)
+            batched.add_done_callback(self.batched_jobs.discard)
+        else:
+            # Add to processing queue
+            await self.job_queue.put(job_data)
+        
         logger.info(f"📝 Generation job submitted: {job_id}")
         return job_id
     
@@ -209,8 +236,11 @@ class JobProcessor:
             # Update progress
             await self._update_progress(job_id, 30, "Generating assets...", 2, 4)
             
-            # Generate assets
-            assets = await self.ai_pipeline.generate_assets(request)
+            # Generate assets, sharing a pipeline call with concurrent requests when possible
+            if self.batcher and self.batcher.accepts(request):
+                assets = await self.batcher.process(request)
+            else:
+                assets = await self.ai_pipeline.generate_assets(request)
             
             # Update progress
             await self._update_progress(job_id, 70, "Saving assets...", 3, 4)
@@ -225,19 +255,20 @@ class JobProcessor:
             # Update progress
             await self._update_progress(job_id, 100, "Completed", 4, 4)
             
-            # Create response
-            response = GenerationResponse(
+            # Create response (server-built, so skip validation)
+            response = GenerationResponseStruct(
                 request_id=request.request_id,
                 status="completed",
                 assets=saved_assets,
                 total_generated=len(saved_assets),
                 successful=len(saved_assets),
                 failed=0,
-                total_processing_time=sum(asset.processing_time for asset in saved_assets)
+                total_processing_time=sum(asset.processing_time for asset in saved_assets),
+                completed_at=datetime.now()
             )
             
             # Store results
-            await self._store_job_results(job_id, response.dict())
+            await self._store_job_results(job_id, msgspec.json.encode(response))
             
             logger.info(f"✅ Generation job {job_id} completed - {len(saved_assets)} assets")
             
@@ -302,7 +333,7 @@ class JobProcessor:
             await self._update_progress(job_id, 100, "Training completed", 5, 5)
             
             # Store results
-            await self._store_job_results(job_id, response.dict())
+            await self._store_job_results(job_id, response.model_dump_json())
             
             logger.info(f"✅ Training job {job_id} completed - Style pack: {request.name}")
             
@@ -378,16 +409,32 @@ class JobProcessor:
         offset: int = 0
     ) -> List[JobInfo]:
         """List jobs with optional filtering"""
+        if limit <= 0:
+            return []  # LRANGE offset..offset-1 would wrap to the end of the list
+        
         try:
-            # Get all job IDs
-            job_ids = await self.redis_client.lrange(self.job_list_key, 0, -1)
+            # Get the requested page of job IDs
+            job_ids = await self.redis_client.lrange(self.job_list_key, offset, offset + limit - 1)
+            if not job_ids:
+                return []
+            
+            # Fetch every job on the page in one round trip
+            job_data = await self.redis_client.mget(
+                [f"{self.job_key_prefix}{job_id}" for job_id in job_ids]
+            )
             
             jobs = []
-            for job_id in job_ids[offset:offset + limit]:
-                job_info = await self.get_job_status(job_id)
-                if job_info:
-                    if status is None or job_info.status == status:
-                        jobs.append(job_info)
+            for job_id, data in zip(job_ids, job_data):
+                if not data:
+                    continue
+                # Decode each record on its own so one corrupt job does not hide the page
+                try:
+                    job_info = JobInfo(**json.loads(data))
+                except Exception as e:
+                    logger.warning(f"Skipping unreadable job {job_id}: {e}")
+                    continue
+                if status is None or job_info.status == status:
+                    jobs.append(job_info)
             
             return jobs
             
@@ -401,7 +448,7 @@ class JobProcessor:
             # Store job info
             await self.redis_client.set(
                 f"{self.job_key_prefix}{job_id}",
-                json.dumps(job_info.dict(), default=str),
+                job_info.model_dump_json(),
                 ex=86400  # Expire after 24 hours
             )
             
@@ -464,12 +511,12 @@ class JobProcessor:
         except Exception as e:
             logger.error(f"Failed to update job progress {job_id}: {e}")
     
-    async def _store_job_results(self, job_id: str, results: Dict[str, Any]):
-        """Store job results"""
+    async def _store_job_results(self, job_id: str, results: Union[str, bytes]):
+        """Store job results (already JSON encoded)"""
         try:
             await self.redis_client.set(
                 f"{self.job_result_prefix}{job_id}",
-                json.dumps(results, default=str),
+                results,
                 ex=86400  # Expire after 24 hours
             )
             
@@ -1,7 +1,7 @@
 # FastAPI Asset Generation Service
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, File, UploadFile
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, File, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, Response
 from contextlib import asynccontextmanager
 import asyncio
 import logging
@@ -9,14 +9,17 @@ import os
 from typing import List, Optional, Dict, Any
 import redis.asyncio as redis
 import json
+import orjson
 from datetime import datetime
+from pathlib import Path
 
-from config import Settings
+from config import get_settings
 from models import (
     GenerationRequest, GenerationResponse, StylePackRequest, StylePackResponse,
     JobInfo, JobStatus, HealthResponse, ModelInfo, GeneratedAsset
 )
 from ai_pipeline import AIPipeline
+from batcher import GenerationBatcher
 from job_processor import JobProcessor
 from storage import StorageManager
 
@@ -25,16 +28,17 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Global state
-settings = Settings()
+settings = get_settings()
 ai_pipeline: Optional[AIPipeline] = None
 job_processor: Optional[JobProcessor] = None
+batcher: Optional[GenerationBatcher] = None
 storage_manager: Optional[StorageManager] = None
 redis_client: Optional[redis.Redis] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
-    global ai_pipeline, job_processor, storage_manager, redis_client
+    global ai_pipeline, job_processor, storage_manager, redis_client, batcher
     
     try:
         logger.info("🚀 Starting Asset Generation Service...")
@@ -57,8 +61,17 @@ async def lifespan(app: FastAPI):
         await ai_pipeline.initialize()
         logger.info("✅ AI pipeline initialized")
         
+        # Start request batcher
+        batcher = GenerationBatcher(
+            ai_pipeline,
+            max_batch_size=settings.max_batch_size,
+            max_wait_ms=settings.batch_max_wait_ms
+        )
+        await batcher.start()
+        logger.info("✅ Request batcher started")
+        
         # Initialize job processor
-        job_processor = JobProcessor(ai_pipeline, storage_manager, redis_client)
+        job_processor = JobProcessor(ai_pipeline, storage_manager, redis_client, batcher)
         await job_processor.start()
         logger.info("✅ Job processor started")
         
@@ -76,6 +89,9 @@ async def lifespan(app: FastAPI):
         if job_processor:
             await job_processor.stop()
             
+        if batcher:
+            await batcher.stop()
+            
         if ai_pipeline:
             await ai_pipeline.cleanup()
             
@@ -84,19 +100,36 @@ async def lifespan(app: FastAPI):
             
         logger.info("👋 Asset Generation Service stopped")
 
+def _orjson_default(obj: Any) -> Any:
+    """Fallback encoder for types orjson does not handle natively"""
+    if isinstance(obj, Path):
+        return str(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def orjson_response(obj: Any, status: int = 200) -> Response:
+    """Encode a payload with orjson, bypassing jsonable_encoder and response_model validation"""
+    return Response(
+        orjson.dumps(obj, default=_orjson_default),
+        media_type="application/json",
+        status_code=status
+    )
+
 # Create FastAPI app
 app = FastAPI(
     title="GameForge Asset Generation Service",
     description="AI-powered game asset generation with SDXL and LoRA",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Configure appropriately for production
-    allow_credentials=True,
+    allow_credentials=False,  # API-key auth, no cookies; with credentials Starlette would echo any Origin
     allow_methods=["*"],
     allow_headers=["*"],
 )
@@ -106,14 +139,17 @@ app.add_middleware(
 async def health_check():
     """Check service health"""
     try:
-        # Check Redis
-        redis_connected = False
-        if redis_client:
+        # Check Redis and storage concurrently
+        async def check_redis() -> bool:
             try:
-                await redis_client.ping()
-                redis_connected = True
+                return bool(redis_client and await redis_client.ping())
             except:
-                pass
+                return False
+        
+        async def check_storage() -> bool:
+            return storage_manager is not None and await storage_manager.health_check()
+        
+        redis_connected, storage_accessible = await asyncio.gather(check_redis(), check_storage())
         
         # Check AI pipeline
         models_loaded = ai_pipeline is not None and ai_pipeline.is_ready()
@@ -124,13 +160,13 @@ async def health_check():
         if ai_pipeline:
             memory_usage = ai_pipeline.get_memory_usage()
         
-        return HealthResponse(
+        return orjson_response(HealthResponse(
             models_loaded=models_loaded,
             gpu_available=gpu_available,
             memory_usage=memory_usage,
             redis_connected=redis_connected,
-            storage_accessible=storage_manager is not None and await storage_manager.health_check()
-        )
+            storage_accessible=storage_accessible
+        ).model_dump())
         
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -149,11 +185,11 @@ async def generate_assets(request: GenerationRequest, background_tasks: Backgrou
         
         logger.info(f"🎨 Generation job submitted: {job_id}")
         
-        return {
+        return orjson_response({
             "job_id": job_id,
             "status": "submitted",
             "message": "Asset generation job submitted successfully"
-        }
+        })
         
     except Exception as e:
         logger.error(f"Generation request failed: {e}")
@@ -172,11 +208,11 @@ async def train_style_pack(request: StylePackRequest, background_tasks: Backgrou
         
         logger.info(f"🎭 Style training job submitted: {job_id}")
         
-        return {
+        return orjson_response({
             "job_id": job_id,
             "status": "submitted",
             "message": "Style pack training job submitted successfully"
-        }
+        })
         
     except Exception as e:
         logger.error(f"Style training request failed: {e}")
@@ -194,7 +230,7 @@ async def get_job_status(job_id: str):
         if not job_info:
             raise HTTPException(status_code=404, detail="Job not found")
         
-        return job_info
+        return orjson_response(job_info.model_dump())
         
     except HTTPException:
         raise
@@ -214,7 +250,7 @@ async def get_job_results(job_id: str):
         if not results:
             raise HTTPException(status_code=404, detail="Job results not found")
         
-        return results
+        return orjson_response(results)
         
     except HTTPException:
         raise
@@ -255,7 +291,7 @@ async def list_jobs(
             raise HTTPException(status_code=503, detail="Service not ready")
         
         jobs = await job_processor.list_jobs(status=status, limit=limit, offset=offset)
-        return {"jobs": jobs}
+        return orjson_response({"jobs": [job.model_dump() for job in jobs]})
         
     except Exception as e:
         logger.error(f"Failed to list jobs: {e}")
@@ -270,7 +306,7 @@ async def get_models():
             raise HTTPException(status_code=503, detail="AI pipeline not ready")
         
         models = ai_pipeline.get_model_info()
-        return models
+        return orjson_response([model.model_dump() for model in models])
         
     except Exception as e:
         logger.error(f"Failed to get model info: {e}")
@@ -318,20 +354,34 @@ async def unload_model(model_id: str):
 
 # Asset download endpoint
 @app.get("/assets/{asset_id}")
-async def download_asset(asset_id: str):
+async def download_asset(asset_id: str, request: Request):
     """Download a generated asset"""
     try:
         if not storage_manager:
             raise HTTPException(status_code=503, detail="Storage not ready")
         
         file_path = await storage_manager.get_asset_path(asset_id)
-        if not file_path or not os.path.exists(file_path):
+        try:
+            stat_result = os.stat(file_path) if file_path else None
+        except FileNotFoundError:
+            stat_result = None
+        if stat_result is None:
             raise HTTPException(status_code=404, detail="Asset not found")
         
+        # Generated assets never change in place, so mtime + size identifies the content
+        headers = {
+            "ETag": f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+            "Cache-Control": "public, max-age=86400"
+        }
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+        
+        # media_type is guessed from the file extension
         return FileResponse(
             file_path,
-            media_type="application/octet-stream",
-            filename=os.path.basename(file_path)
+            filename=os.path.basename(file_path),
+            headers=headers,
+            stat_result=stat_result
         )
         
     except HTTPException:
@@ -348,23 +398,37 @@ async def upload_reference_images(files: List[UploadFile] = File(...)):
         if not storage_manager:
             raise HTTPException(status_code=503, detail="Storage not ready")
         
-        uploaded_files = []
-        for file in files:
+        async def save_one(file: UploadFile) -> Dict[str, Any]:
             # Validate file type
-            if not file.content_type.startswith('image/'):
-                raise HTTPException(status_code=400, detail=f"Invalid file type: {file.content_type}")
+            if not file.content_type or not file.content_type.startswith('image/'):
+                raise ValueError(f"Invalid file type: {file.content_type}")
             
             # Save file
             file_path = await storage_manager.save_reference_image(file)
-            uploaded_files.append({
+            return {
                 "filename": file.filename,
                 "path": file_path,
                 "size": file.size
-            })
+            }
+        
+        # Save all files concurrently
+        results = await asyncio.gather(*[save_one(file) for file in files], return_exceptions=True)
+        
+        uploaded_files = []
+        failed_files = []
+        for file, result in zip(files, results):
+            if isinstance(result, Exception):
+                failed_files.append({"filename": file.filename, "error": str(result)})
+            else:
+                uploaded_files.append(result)
+        
+        if failed_files and not uploaded_files:
+            raise HTTPException(status_code=400, detail=failed_files)
         
         return {
             "message": f"Uploaded {len(uploaded_files)} reference images",
-            "files": uploaded_files
+            "files": uploaded_files,
+            "failed": failed_files
         }
         
     except HTTPException:
@@ -390,5 +454,10 @@ if __name__ == "__main__":
         host=settings.host,
         port=settings.port,
         reload=settings.debug,
-        workers=1  # Single worker for GPU operations
+        workers=1,  # Single worker for GPU operations
+        loop="uvloop" if os.name != "nt" else "asyncio",  # uvloop has no Windows build
+        http="httptools",
+        log_level=settings.log_level.lower(),
+        access_log=False,  # Per-request log lines are synchronous writes on the event loop
+        backlog=2048
     )
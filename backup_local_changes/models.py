@@ -1,9 +1,10 @@
 # Asset Generation Data Models
-from pydantic import BaseModel, Field, validator
-from typing import Optional, List, Dict, Any, Literal
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationInfo, field_validator
+from typing import Annotated, Optional, List, Dict, Any, Literal
 from enum import Enum
 import uuid
 from datetime import datetime
+import msgspec
 
 class AssetType(str, Enum):
     CHARACTER_DESIGN = "character-design"
@@ -31,6 +32,23 @@ class AssetFormat(str, Enum):
     SVG = "svg"
     JPG = "jpg"
 
+def _enum_value(value: Any) -> Any:
+    """Unwrap enum members so Python callers can keep passing AssetType.X etc."""
+    return getattr(value, "value", value)
+
+# Request fields validate against these Literals (a set lookup in pydantic-core) rather
+# than the enums above; the values stay plain strings, which compare equal to the enum members
+AssetTypeValue = Annotated[
+    Literal["character-design", "environment-art", "prop-design", "ui-element", "concept-art"],
+    BeforeValidator(_enum_value)
+]
+StyleTypeValue = Annotated[
+    Literal["pixel-art", "hand-drawn", "realistic", "cartoon", "minimalist"],
+    BeforeValidator(_enum_value)
+]
+QualityLevelValue = Annotated[Literal["draft", "standard", "high", "production"], BeforeValidator(_enum_value)]
+AssetFormatValue = Annotated[Literal["png", "webp", "svg", "jpg"], BeforeValidator(_enum_value)]
+
 # Request Models
 class GenerationRequest(BaseModel):
     """Main asset generation request"""
@@ -39,9 +57,9 @@ class GenerationRequest(BaseModel):
     negative_prompt: Optional[str] = Field(None, max_length=1000)
     
     # Asset Configuration
-    asset_type: AssetType
-    style: Optional[StyleType] = None
-    quality: QualityLevel = QualityLevel.STANDARD
+    asset_type: AssetTypeValue
+    style: Optional[StyleTypeValue] = None
+    quality: QualityLevelValue = QualityLevel.STANDARD.value
     
     # Generation Parameters
     width: int = Field(512, ge=64, le=2048)
@@ -57,7 +75,7 @@ class GenerationRequest(BaseModel):
     lora_scales: Optional[List[float]] = None
     
     # Output Configuration
-    format: AssetFormat = AssetFormat.PNG
+    format: AssetFormatValue = AssetFormat.PNG.value
     transparent_background: bool = True
     optimize_for_game: bool = True
     
@@ -71,10 +89,11 @@ class GenerationRequest(BaseModel):
     user_id: Optional[str] = None
     tags: List[str] = Field(default_factory=list)
     
-    @validator('lora_scales')
-    def validate_lora_scales(cls, v, values):
-        if v and 'lora_weights' in values:
-            lora_weights = values.get('lora_weights', [])
+    @field_validator('lora_scales')
+    @classmethod
+    def validate_lora_scales(cls, v: Optional[List[float]], info: ValidationInfo) -> Optional[List[float]]:
+        if v and 'lora_weights' in info.data:
+            lora_weights = info.data.get('lora_weights') or []
             if len(v) != len(lora_weights):
                 raise ValueError("Number of LoRA scales must match number of LoRA weights")
         return v
@@ -134,8 +153,44 @@ class GeneratedAsset(BaseModel):
     created_at: datetime = Field(default_factory=datetime.now)
     metadata: Dict[str, Any] = Field(default_factory=dict)
 
+class GeneratedAssetStruct(msgspec.Struct, kw_only=True, dict=True):
+    """GeneratedAsset as built by the pipeline
+    
+    Assets are created server-side for every image and only ever encoded,
+    so they skip pydantic entirely. dict=True lets the pipeline attach the
+    processed image for the storage manager without it being encoded.
+    """
+    id: str = msgspec.field(default_factory=lambda: str(uuid.uuid4()))
+    url: str
+    thumbnail_url: Optional[str] = None
+    filename: str
+    
+    # Technical Details
+    width: int
+    height: int
+    format: str
+    file_size: int
+    
+    # Generation Details
+    prompt: str
+    negative_prompt: Optional[str] = None
+    seed: int
+    steps: int
+    guidance_scale: float
+    model_used: str
+    
+    # Quality Metrics
+    quality_score: Optional[float] = None
+    processing_time: float
+    
+    # Metadata
+    created_at: datetime = msgspec.field(default_factory=datetime.now)
+    metadata: Dict[str, Any] = msgspec.field(default_factory=dict)
+
 class GenerationResponse(BaseModel):
     """Response from asset generation"""
+    model_config = ConfigDict(frozen=True, extra='ignore')
+    
     request_id: str
     status: Literal["completed", "failed", "processing"]
     
@@ -158,8 +213,24 @@ class GenerationResponse(BaseModel):
     # Metadata
     completed_at: datetime = Field(default_factory=datetime.now)
 
+class GenerationResponseStruct(msgspec.Struct, gc=False):
+    """GenerationResponse as stored for a finished job, encoded with msgspec"""
+    request_id: str
+    status: Literal["completed", "failed", "processing"]
+    assets: List[GeneratedAssetStruct] = msgspec.field(default_factory=list)
+    total_generated: int = 0
+    successful: int = 0
+    failed: int = 0
+    total_processing_time: float = 0.0
+    average_quality_score: Optional[float] = None
+    error_message: Optional[str] = None
+    error_details: Optional[Dict[str, Any]] = None
+    completed_at: datetime = msgspec.field(default_factory=datetime.now)
+
 class StylePackResponse(BaseModel):
     """Response from style pack training"""
+    model_config = ConfigDict(frozen=True, extra='ignore')
+    
     style_pack_id: str
     name: str
     status: Literal["training", "completed", "failed"]
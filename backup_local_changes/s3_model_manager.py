@@ -5,14 +5,41 @@ import os
 import json
 import logging
 import asyncio
+import shutil
+import uuid
+from contextlib import AsyncExitStack
 from typing import Dict, List, Optional
-import boto3
+import aioboto3
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
 import aiofiles
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+
+# Files above this size are fetched as parallel byte-range GETs
+LARGE_FILE_THRESHOLD = 64 * MB
+RANGE_PARTS = 16
+MAX_LARGE_DOWNLOADS = 4
+
+# Per-model record of the S3 ETag and size of each downloaded file
+ETAGS_FILE = ".etags.json"
+
+# Enough pooled connections for every range of every concurrent large download, adaptive
+# retries to back off under S3 throttling, and Transfer Acceleration for buckets that
+# have it enabled (S3_USE_ACCELERATE=true); AWS_USE_DUALSTACK_ENDPOINT is read by botocore
+S3_CLIENT_CONFIG = Config(
+    max_pool_connections=RANGE_PARTS * MAX_LARGE_DOWNLOADS,
+    retries={'mode': 'adaptive', 'max_attempts': 5},
+    tcp_keepalive=True,
+    s3={
+        'addressing_style': 'virtual',
+        'use_accelerate_endpoint': os.getenv('S3_USE_ACCELERATE', 'false').lower() == 'true'
+    }
+)
+
 class S3ModelManager:
     """Manages SDXL model downloads and caching from S3"""
     
@@ -24,6 +51,8 @@ class S3ModelManager:
         self.cache_dir = Path(cache_dir)
         self.region = region
         self.s3_client = None
+        self._exit_stack: Optional[AsyncExitStack] = None
+        self._cleanup_tasks: set = set()  # Keeps background staging removals referenced
         
         # Ensure cache directory exists
         self.cache_dir.mkdir(parents=True, exist_ok=True)
@@ -32,7 +61,10 @@ class S3ModelManager:
         """Initialize S3 client and verify connectivity"""
         try:
             # Initialize S3 client
-            self.s3_client = boto3.client('s3', region_name=self.region)
+            self._exit_stack = AsyncExitStack()
+            self.s3_client = await self._exit_stack.enter_async_context(
+                aioboto3.Session().client('s3', region_name=self.region, config=S3_CLIENT_CONFIG)
+            )
             
             # Test connectivity
             await self._test_s3_connectivity()
@@ -41,19 +73,24 @@ class S3ModelManager:
             
         except NoCredentialsError:
             logger.error("❌ AWS credentials not configured")
+            await self.close()
             return False
         except Exception as e:
             logger.error(f"❌ Failed to initialize S3 Model Manager: {e}")
+            await self.close()
             return False
     
+    async def close(self):
+        """Close the async S3 client"""
+        if self._exit_stack:
+            await self._exit_stack.aclose()
+            self._exit_stack = None
+            self.s3_client = None
+    
     async def _test_s3_connectivity(self):
         """Test S3 connectivity by listing bucket"""
         try:
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None, 
-                lambda: self.s3_client.head_bucket(Bucket=self.bucket_name)
-            )
+            await self.s3_client.head_bucket(Bucket=self.bucket_name)
         except ClientError as e:
             error_code = e.response['Error']['Code']
             if error_code == '404':
@@ -64,23 +101,34 @@ class S3ModelManager:
                 raise Exception(f"S3 connectivity test failed: {e}")
     
     async def download_model(self, model_name: str, force_download: bool = False) -> str:
-        """Download model from S3 to local cache"""
+        """Download model from S3 to local cache, fetching only files that changed"""
         model_cache_path = self.cache_dir / model_name
+        etags_path = model_cache_path / ETAGS_FILE
+        
+        # Files are staged here and renamed into place once complete, so other
+        # readers of the model directory never see a half-written file
+        staging_path = self.cache_dir / f".{model_name}.tmp.{uuid.uuid4().hex}"
+        
+        # ETag and size of every file from the last successful download
+        cached_etags = self._load_etags(etags_path)
         
-        # Check if model already exists locally
-        if model_cache_path.exists() and not force_download:
+        # A complete local copy is used as is, without touching S3
+        if not force_download and self._cache_complete(model_cache_path, cached_etags):
             logger.info(f"📦 Model {model_name} already cached locally")
             return str(model_cache_path)
+        if force_download:
+            cached_etags = {}
         
-        logger.info(f"📥 Downloading model {model_name} from S3...")
-        
+        listed = False
         try:
+            if self.s3_client is None:
+                raise Exception("S3 client not initialized")
+            
             # Create model directory
             model_cache_path.mkdir(parents=True, exist_ok=True)
             
             # List all objects with the model prefix
             s3_prefix = f"{model_name}/"
-            loop = asyncio.get_event_loop()
             
             paginator = self.s3_client.get_paginator('list_objects_v2')
             page_iterator = paginator.paginate(
@@ -89,41 +137,73 @@ class S3ModelManager:
             )
             
             download_tasks = []
+            current_etags = {}
             total_files = 0
             
-            for page in page_iterator:
+            async for page in page_iterator:
                 if 'Contents' not in page:
                     continue
                     
                 for obj in page['Contents']:
                     s3_key = obj['Key']
-                    local_path = model_cache_path / s3_key[len(s3_prefix):]
+                    relative_path = s3_key[len(s3_prefix):]
+                    total_files += 1
+                    
+                    # Skip files that are unchanged since the last download
+                    current_etags[relative_path] = [obj['ETag'], obj['Size']]
+                    if (cached_etags.get(relative_path) == current_etags[relative_path]
+                            and (model_cache_path / relative_path).exists()):
+                        continue
                     
                     # Create parent directories
+                    local_path = staging_path / relative_path
                     local_path.parent.mkdir(parents=True, exist_ok=True)
                     
-                    # Schedule download
-                    task = self._download_file(s3_key, local_path)
-                    download_tasks.append(task)
-                    total_files += 1
+                    # Schedule download: weight shards as byte ranges, configs as a single GET
+                    if obj['Size'] >= LARGE_FILE_THRESHOLD:
+                        task = self._download_large_file(s3_key, local_path, obj['Size'])
+                    else:
+                        task = self._download_file(s3_key, local_path)
+                    download_tasks.append((relative_path, obj['Size'], task))
+            
+            listed = True
             
             if total_files == 0:
                 raise Exception(f"No files found for model {model_name} in S3")
             
-            logger.info(f"📥 Downloading {total_files} files for {model_name}...")
+            if not download_tasks:
+                logger.info(f"📦 Model {model_name} already cached locally")
+                return str(model_cache_path)
+            
+            logger.info(f"📥 Downloading {len(download_tasks)} of {total_files} files for {model_name}...")
             
-            # Download all files concurrently (with limit)
-            semaphore = asyncio.Semaphore(5)  # Limit concurrent downloads
+            # Download files concurrently (with limits); each large file also fans out
+            # into RANGE_PARTS ranged requests of its own
+            semaphore = asyncio.Semaphore(32)  # Limit concurrent small downloads
+            large_semaphore = asyncio.Semaphore(MAX_LARGE_DOWNLOADS)
             
-            async def limited_download(task):
-                async with semaphore:
+            async def limited_download(size, task):
+                limit = large_semaphore if size >= LARGE_FILE_THRESHOLD else semaphore
+                async with limit:
                     return await task
             
             download_results = await asyncio.gather(
-                *[limited_download(task) for task in download_tasks],
+                *[limited_download(size, task) for _, size, task in download_tasks],
                 return_exceptions=True
             )
             
+            # Move every completed file into place (an atomic rename on the same
+            # filesystem) and record it, so a retry only fetches the failures
+            for (path, _, _), result in zip(download_tasks, download_results):
+                if isinstance(result, Exception):
+                    # No ETag: fetched again next time, and the cache never counts as complete
+                    current_etags[path][0] = None
+                    continue
+                target_path = model_cache_path / path
+                target_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(staging_path / path, target_path)
+            self._save_etags(etags_path, current_etags)
+            
             # Check for failures
             failed_downloads = [r for r in download_results if isinstance(r, Exception)]
             if failed_downloads:
@@ -136,23 +216,108 @@ class S3ModelManager:
             return str(model_cache_path)
             
         except Exception as e:
+            # S3 unreachable: a usable local copy beats failing the load
+            if not listed and (self._cache_complete(model_cache_path, self._load_etags(etags_path))
+                               or await self.verify_model_integrity(model_name)):
+                logger.warning(f"⚠️ Could not reach S3 ({e}), using cached model {model_name}")
+                return str(model_cache_path)
             logger.error(f"❌ Failed to download model {model_name}: {e}")
-            # Cleanup partial download
-            if model_cache_path.exists():
-                import shutil
-                shutil.rmtree(model_cache_path, ignore_errors=True)
             raise
+        
+        finally:
+            # Whatever is left in staging are failed partial files; remove them off the request path
+            if staging_path.exists():
+                cleanup = asyncio.create_task(asyncio.to_thread(shutil.rmtree, staging_path, ignore_errors=True))
+                self._cleanup_tasks.add(cleanup)
+                cleanup.add_done_callback(self._cleanup_tasks.discard)
+    
+    @staticmethod
+    def _cache_complete(model_cache_path: Path, etags: Dict[str, List]) -> bool:
+        """Whether every file recorded by the last download is present with its recorded size"""
+        if not etags:
+            return False
+        for relative_path, (etag, size) in etags.items():
+            if etag is None:
+                return False  # Failed to download last time
+            try:
+                if (model_cache_path / relative_path).stat().st_size != size:
+                    return False
+            except FileNotFoundError:
+                return False
+        return True
+    
+    @staticmethod
+    def _load_etags(etags_path: Path) -> Dict[str, List]:
+        """Load the recorded [ETag, size] of each downloaded file"""
+        try:
+            return json.loads(etags_path.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    @staticmethod
+    def _save_etags(etags_path: Path, etags: Dict[str, List]):
+        """Atomically replace the recorded ETags"""
+        tmp_path = etags_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(etags))
+        os.replace(tmp_path, etags_path)
     
     async def _download_file(self, s3_key: str, local_path: Path):
-        """Download a single file from S3"""
+        """Download a single file from S3, streaming it to disk"""
         try:
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                lambda: self.s3_client.download_file(
-                    self.bucket_name, s3_key, str(local_path)
-                )
+            response = await self.s3_client.get_object(Bucket=self.bucket_name, Key=s3_key)
+            # Closes the body (and releases its connection) even if the write fails partway
+            async with response['Body'] as body, aiofiles.open(local_path, 'wb') as f:
+                async for chunk in body.iter_chunks(MB):
+                    await f.write(chunk)
+            logger.debug(f"✅ Downloaded {s3_key}")
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to download {s3_key}: {e}")
+            raise
+    
+    async def _download_large_file(self, s3_key: str, local_path: Path, size: int):
+        """Download a large file from S3 as parallel byte-range GETs written in place"""
+        part_size = -(-size // RANGE_PARTS)
+        
+        async def fetch_range(fd: int, start: int):
+            end = min(start + part_size, size) - 1
+            response = await self.s3_client.get_object(
+                Bucket=self.bucket_name, Key=s3_key, Range=f"bytes={start}-{end}"
             )
+            offset = start
+            async with response['Body'] as body:
+                async for chunk in body.iter_chunks(MB):
+                    # Disk writes go to a thread so they never stall the event loop. Cancelling
+                    # cannot stop a write already in that thread, so wait it out before
+                    # propagating; the caller closes the fd once every range has returned.
+                    write = asyncio.ensure_future(asyncio.to_thread(os.pwrite, fd, chunk, offset))
+                    try:
+                        await asyncio.shield(write)
+                    except asyncio.CancelledError:
+                        await asyncio.gather(write, return_exceptions=True)
+                        raise
+                    offset += len(chunk)
+        
+        try:
+            fd = os.open(local_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                # Preallocate so ranges can be written at their offsets in any order
+                if hasattr(os, "posix_fallocate"):
+                    await asyncio.to_thread(os.posix_fallocate, fd, 0, size)
+                else:
+                    os.ftruncate(fd, size)
+                
+                tasks = [asyncio.create_task(fetch_range(fd, start)) for start in range(0, size, part_size)]
+                try:
+                    await asyncio.gather(*tasks)
+                finally:
+                    # gather does not cancel the other ranges when one fails; stop them and wait
+                    # for them all, so none writes to the fd number after it is closed and reused
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+            finally:
+                os.close(fd)
             logger.debug(f"✅ Downloaded {s3_key}")
             
         except Exception as e:
@@ -165,17 +330,15 @@ class S3ModelManager:
             manifest_key = "model-manifest.json"
             local_manifest = self.cache_dir / "manifest.json"
             
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                lambda: self.s3_client.download_file(
-                    self.bucket_name, manifest_key, str(local_manifest)
-                )
-            )
+            response = await self.s3_client.get_object(Bucket=self.bucket_name, Key=manifest_key)
+            async with response['Body'] as body:
+                manifest_data = await body.read()
             
-            async with aiofiles.open(local_manifest, 'r') as f:
-                manifest_data = await f.read()
-                return json.loads(manifest_data)
+            # Keep a local copy alongside the cached models
+            async with aiofiles.open(local_manifest, 'wb') as f:
+                await f.write(manifest_data)
+            
+            return json.loads(manifest_data)
                 
         except Exception as e:
             logger.warning(f"⚠️ Could not load model manifest: {e}")
@@ -184,8 +347,6 @@ class S3ModelManager:
     async def list_available_models(self) -> List[str]:
         """List available models in S3 bucket"""
         try:
-            loop = asyncio.get_event_loop()
-            
             paginator = self.s3_client.get_paginator('list_objects_v2')
             page_iterator = paginator.paginate(
                 Bucket=self.bucket_name,
@@ -193,7 +354,7 @@ class S3ModelManager:
             )
             
             models = set()
-            for page in page_iterator:
+            async for page in page_iterator:
                 if 'CommonPrefixes' in page:
                     for prefix in page['CommonPrefixes']:
                         model_name = prefix['Prefix'].rstrip('/')
@@ -249,3 +410,11 @@ async def get_s3_model_manager() -> S3ModelManager:
         await s3_model_manager.initialize()
     
     return s3_model_manager
+
+async def close_s3_model_manager():
+    """Close the S3 model manager instance, if one was created"""
+    global s3_model_manager
+    
+    if s3_model_manager is not None:
+        await s3_model_manager.close()
+        s3_model_manager = None
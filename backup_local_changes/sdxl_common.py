@@ -0,0 +1,180 @@
+"""
+GameForge SDXL Service Helpers
+Image encoding, attention and dtype probes, step previews and request batching shared by the SDXL services
+"""
+
+import os
+import io
+import json
+import base64
+import asyncio
+import logging
+from contextlib import nullcontext
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+from PIL import Image
+
+from batcher import AsyncBatcher
+
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:  # sdxl_service_minimal only uses the image encoders and ships without torch
+    TORCH_AVAILABLE = False
+
+try:
+    import numpy as np
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    TURBOJPEG = TurboJPEG()  # SIMD libjpeg-turbo encoder
+except (ImportError, OSError):  # OSError: the libturbojpeg shared library is missing
+    TURBOJPEG = None
+
+try:
+    import pybase64  # SIMD base64
+    b64encode_str = pybase64.b64encode_as_string
+except ImportError:
+    def b64encode_str(data: bytes) -> str:
+        return base64.b64encode(data).decode('ascii')
+
+logger = logging.getLogger(__name__)
+
+# Step previews for /generate/stream: every PREVIEW_EVERY steps the latents are projected
+# straight to RGB with these SDXL factors (1/8 of the output size, no VAE decode)
+PREVIEW_EVERY = int(os.getenv("PREVIEW_EVERY", "5"))
+LATENT_RGB_FACTORS = [
+    [0.3651, 0.4232, 0.4341],
+    [-0.2533, -0.0042, 0.1068],
+    [0.1076, 0.1111, -0.0362],
+    [-0.3165, -0.2492, -0.2188]
+]
+LATENT_RGB_BIAS = [0.1084, 0.0126, -0.0161]
+
+# CPU inference dtype: "auto" uses bf16 when oneDNN has bf16 kernels (AVX512-BF16 / AMX), else fp32
+SDXL_CPU_DTYPE = os.getenv("SDXL_CPU_DTYPE", "auto").lower()
+
+def _attention_backend() -> Optional[str]:
+    """Fused attention this environment supports: PyTorch SDPA (preferred), else xFormers on CUDA"""
+    if hasattr(torch.nn.functional, "scaled_dot_product_attention"):
+        return "sdpa"
+    try:
+        import xformers.ops as xops
+        xops.memory_efficient_attention  # noqa: B018 - attribute probe
+    except (ImportError, AttributeError):
+        return None
+    return "xformers" if torch.cuda.is_available() else None
+
+# Probed once at import so every load (and every worker) makes the same choice
+ATTENTION_BACKEND = _attention_backend() if TORCH_AVAILABLE else None
+
+def encode_image(image: Image.Image, format: str) -> bytes:
+    """Encode a PIL image as JPEG (libjpeg-turbo when available) or PNG"""
+    buffer = io.BytesIO()
+    if format == "png":
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+    image = image.convert("RGB")
+    if TURBOJPEG is not None:
+        return TURBOJPEG.encode(np.asarray(image), quality=92, pixel_format=TJPF_RGB)
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+def encode_image_base64(image: Image.Image, format: str) -> str:
+    """Encode a PIL image and base64 it, in one call so both run off the event loop"""
+    return b64encode_str(encode_image(image, format))
+
+def latents_to_preview(latents: "torch.Tensor") -> Image.Image:
+    """Approximate RGB preview of the first image in a batch of denoising latents"""
+    factors = torch.tensor(LATENT_RGB_FACTORS, dtype=latents.dtype, device=latents.device)
+    bias = torch.tensor(LATENT_RGB_BIAS, dtype=latents.dtype, device=latents.device)
+    rgb = torch.einsum("chw,cr->hwr", latents[0], factors) + bias
+    return Image.fromarray(((rgb + 1) / 2).clamp(0, 1).mul(255).byte().cpu().numpy())
+
+def preview_callback(on_preview: Callable[[int, Image.Image], None]):
+    """callback_on_step_end that hands every PREVIEW_EVERY-th step's preview to on_preview"""
+    def callback(pipe, step, timestep, callback_kwargs):
+        if step % PREVIEW_EVERY == 0:
+            on_preview(step, latents_to_preview(callback_kwargs["latents"]))
+        return callback_kwargs
+    return callback
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sdpa_kernels(device: str):
+    """Prefer the flash and memory-efficient SDPA kernels on CUDA
+    
+    The math kernel stays enabled as the fallback for shapes and dtypes the
+    fused kernels reject; without it SDPA raises "No available kernel".
+    """
+    if device != "cuda" or ATTENTION_BACKEND != "sdpa":
+        return nullcontext()
+    return torch.backends.cuda.sdp_kernel(enable_flash=True, enable_mem_efficient=True, enable_math=True)
+
+def cpu_supports_bf16() -> bool:
+    """Whether oneDNN has bf16 kernels on this CPU (AVX512-BF16 / AMX)"""
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+def cpu_dtype() -> "torch.dtype":
+    """dtype for CPU inference, honouring SDXL_CPU_DTYPE ("auto", "bf16" or "fp32")"""
+    if SDXL_CPU_DTYPE == "bf16" or (SDXL_CPU_DTYPE == "auto" and cpu_supports_bf16()):
+        return torch.bfloat16
+    return torch.float32
+
+class PipelineBatcher(AsyncBatcher):
+    """Splits each batch into groups of compatible requests and runs every group as one pipeline call
+    
+    generate_batch(requests) returns one image per request. Requests join a group
+    when batch_key matches and, if given, fits(request, group_size) allows the
+    group to grow to that size. gpu_lock, if given, is held per group, so other
+    pipeline calls (e.g. streaming requests) can run between a batch's groups.
+    """
+    
+    def __init__(
+        self,
+        generate_batch: Callable[[List[Any]], List[Image.Image]],
+        batch_key: Callable[[Any], Tuple],
+        max_batch_size: int = 4,
+        max_wait_ms: int = 20,
+        gpu_lock: Optional[asyncio.Lock] = None,
+        fits: Optional[Callable[[Any, int], bool]] = None
+    ):
+        super().__init__(max_batch_size, max_wait_ms)
+        self.generate_batch = generate_batch
+        self.batch_key = batch_key
+        self.gpu_lock = gpu_lock
+        self.fits = fits
+    
+    def _groups(self, items: List[Any]) -> List[List[int]]:
+        """Indices of the items, grouped by batch_key and capped by fits"""
+        groups: List[List[int]] = []
+        for index, item in enumerate(items):
+            key = self.batch_key(item)
+            for group in groups:
+                if (self.batch_key(items[group[0]]) == key
+                        and (self.fits is None or self.fits(item, len(group) + 1))):
+                    group.append(index)
+                    break
+            else:
+                groups.append([index])
+        return groups
+    
+    async def process_batch(self, items: List[Any]) -> List[Any]:
+        """Run one pipeline call per group, returning each request's image (or exception)"""
+        results: List[Any] = [None] * len(items)
+        for group in self._groups(items):
+            requests = [items[i] for i in group]
+            if len(requests) > 1:
+                logger.info(f"📦 Batching {len(requests)} generation requests")
+            try:
+                # In a worker thread, so requests keep queueing during inference
+                async with self.gpu_lock or nullcontext():
+                    images = await asyncio.to_thread(self.generate_batch, requests)
+            except Exception as e:
+                images = [e] * len(requests)
+            for i, image in zip(group, images):
+                results[i] = image
+        return results
@@ -6,18 +6,53 @@ CPU-optimized with model caching and real SDXL
 
 import os
 import io
-import base64
 import asyncio
 import logging
 import gc
-from typing import Optional, Dict, Any
+import secrets
+import time
+from typing import Optional, Dict, Any, List, Tuple
 from contextlib import asynccontextmanager
 
+# Persist compiled inductor kernels and graphs across restarts (mount this path as a volume)
+os.environ.setdefault(
+    "TORCHINDUCTOR_CACHE_DIR",
+    os.path.join(os.getenv("MODEL_CACHE_DIR", "/app/models"), ".inductor_cache")
+)
+os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+
+# One OpenMP thread per physical core (assumes 2-way SMT), pinned, with a short spin
+# before sleeping; must be set before torch starts its thread pool
+CPU_THREADS = max(1, (os.cpu_count() or 2) // 2)
+os.environ.setdefault("OMP_NUM_THREADS", str(CPU_THREADS))
+os.environ.setdefault("KMP_AFFINITY", "granularity=fine,compact,1,0")
+os.environ.setdefault("KMP_BLOCKTIME", "1")
+
+import numpy as np
 import torch
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel, Field
 import uvicorn
-from diffusers import StableDiffusionXLPipeline, DiffusionPipeline
+from diffusers import StableDiffusionXLPipeline, DiffusionPipeline, DPMSolverMultistepScheduler
+
+from batcher import AsyncBatcher
+from sdxl_common import b64encode_str, cpu_supports_bf16
+
+try:
+    import intel_extension_for_pytorch as ipex
+    IPEX_AVAILABLE = True
+except ImportError:
+    IPEX_AVAILABLE = False
+
+try:
+    import pyspng  # libspng encoder, several times faster than PIL's PNG writer
+    SPNG_AVAILABLE = True
+except ImportError:
+    SPNG_AVAILABLE = False
+
+torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+torch.set_num_interop_threads(1)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,12 +64,74 @@ MODEL_CACHE: Dict[str, Any] = {}
 # Use a smaller, faster SDXL model for CPU inference
 MODEL_ID = "segmind/SSD-1B"  # Smaller SDXL-based model, faster inference
 
+# Sizes compiled at startup so the first requests at common sizes skip compilation
+WARMUP_SIZES = [(512, 512), (1024, 1024)]
+
+# Coalesce concurrent same-shape requests into one batched pipeline call
+ENABLE_DYNAMIC_BATCHING = os.getenv("ENABLE_DYNAMIC_BATCHING", "0") == "1"
+MAX_BATCH = int(os.getenv("MAX_BATCH", "4"))
+BATCH_WAIT_MS = int(os.getenv("BATCH_WAIT_MS", "20"))
+
+# After a generation, collect garbage only every N requests or under memory pressure
+CLEANUP_EVERY_N_REQUESTS = int(os.getenv("CLEANUP_EVERY_N_REQUESTS", "50"))
+CLEANUP_MEMORY_PERCENT = float(os.getenv("CLEANUP_MEMORY_PERCENT", "85"))
+
+class PipelineCache:
+    """Bounded pipeline cache that evicts the least frequently used entry
+    
+    Each entry keeps a small hit counter (saturating at 255, all counters
+    halved when one saturates), so picking a victim is a scan over a few
+    integers rather than bookkeeping on every access.
+    """
+    
+    MAX_COUNT = 255
+    
+    def __init__(self, max_size: int):
+        self.max_size = max(1, max_size)
+        self.entries: Dict[str, list] = {}  # key -> [pipeline, hit counter]
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def get(self, key: str):
+        """Return a cached pipeline and count the hit"""
+        entry = self.entries[key]
+        if entry[1] >= self.MAX_COUNT:
+            for other in self.entries.values():
+                other[1] //= 2
+        entry[1] += 1
+        return entry[0]
+    
+    def put(self, key: str, pipeline):
+        """Cache a pipeline, evicting the least used entry when full"""
+        if key not in self.entries and len(self.entries) >= self.max_size:
+            victim = min(self.entries, key=lambda k: self.entries[k][1])
+            self.evict(victim)
+        self.entries[key] = [pipeline, 1]
+    
+    def evict(self, key: str):
+        """Drop a pipeline and release its memory"""
+        if self.entries.pop(key, None) is not None:
+            logger.info(f"♻️ Evicted cached pipeline: {key}")
+            cleanup_memory()
+    
+    def clear(self):
+        """Drop every cached pipeline"""
+        self.entries.clear()
+        cleanup_memory()
+
+# Loaded pipelines, keyed by model id; MODEL_CACHE keeps the metadata
+PIPELINE_CACHE = PipelineCache(int(os.getenv("MAX_CACHED_PIPELINES", "2")))
+
 class ImageRequest(BaseModel):
     prompt: str = Field(..., min_length=1, max_length=500, description="Text prompt")
     negative_prompt: Optional[str] = Field(None, max_length=500)
     width: Optional[int] = Field(512, ge=256, le=1024)
     height: Optional[int] = Field(512, ge=256, le=1024)
-    steps: Optional[int] = Field(20, ge=10, le=30)
+    steps: Optional[int] = Field(15, ge=8, le=30)  # DPM-Solver++ 2M Karras converges in ~15 steps
     guidance_scale: Optional[float] = Field(7.5, ge=1.0, le=15.0)
     seed: Optional[int] = Field(None, ge=0, le=2147483647)
 
@@ -49,6 +146,14 @@ class ModelStatus(BaseModel):
     memory_usage: Dict[str, float]
     optimizations: Dict[str, bool]
 
+def is_intel_cpu() -> bool:
+    """Whether the host CPU is Intel, where IPEX's oneDNN kernels pay off"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            return "GenuineIntel" in f.read()
+    except OSError:
+        return False
+
 def get_memory_info():
     """Get memory usage information"""
     try:
@@ -67,31 +172,55 @@ async def load_optimized_model():
     """Load optimized SDXL model with CPU optimizations"""
     global MODEL_CACHE
     
-    if "pipeline" in MODEL_CACHE:
+    if MODEL_ID in PIPELINE_CACHE:
         logger.info("Model already loaded from cache")
         return
     
     logger.info(f"Loading optimized model: {MODEL_ID}...")
     
     try:
+        # bf16 halves the weight bytes the UNet streams per step; older CPUs stay on float32
+        use_bf16 = cpu_supports_bf16()
+        dtype = torch.bfloat16 if use_bf16 else torch.float32
+        
         # Load with CPU optimizations
-        pipeline = DiffusionPipeline.from_pretrained(
-            MODEL_ID,
-            torch_dtype=torch.float32,  # Use float32 for CPU
+        load_kwargs = dict(
+            torch_dtype=dtype,
             use_safetensors=True,
+            low_cpu_mem_usage=True,  # Load from the mmapped safetensors without an init copy
             safety_checker=None,  # Disable safety checker for faster inference
             requires_safety_checker=False
         )
+        try:
+            pipeline = DiffusionPipeline.from_pretrained(MODEL_ID, **load_kwargs)
+        except (MemoryError, RuntimeError) as e:
+            # Likely out of memory: free every cached pipeline and retry once
+            logger.warning(f"⚠️ Model load failed ({e}), clearing pipeline cache and retrying")
+            PIPELINE_CACHE.clear()
+            pipeline = DiffusionPipeline.from_pretrained(MODEL_ID, **load_kwargs)
+        
+        # DPM-Solver++ 2M with Karras sigmas needs fewer UNet passes than the default scheduler
+        pipeline.scheduler = DPMSolverMultistepScheduler.from_config(
+            pipeline.scheduler.config,
+            algorithm_type="dpmsolver++",
+            use_karras_sigmas=True,
+            solver_order=2
+        )
         
         # CPU optimizations
         pipeline = pipeline.to("cpu")
+        pipeline.unet.to(memory_format=torch.channels_last)
+        pipeline.vae.to(memory_format=torch.channels_last)
+        logger.info(f"✅ Using {'bfloat16' if use_bf16 else 'float32'} weights, channels_last")
         
         # Enable memory efficient attention if available
         optimizations = {
             "memory_efficient_attention": False,
             "cpu_offload": True,
             "safety_checker_disabled": True,
-            "torch_compile": False
+            "torch_compile": False,
+            "bfloat16": use_bf16,
+            "channels_last": True
         }
         
         try:
@@ -102,16 +231,27 @@ async def load_optimized_model():
             logger.warning(f"⚠️ Attention slicing failed: {e}")
             optimizations["attention_slicing"] = False
         
-        # Try torch compile for faster inference (PyTorch 2.0+)
+        # On Intel CPUs, let IPEX fuse ops and prepack weights for oneDNN
+        optimizations["ipex"] = False
+        if IPEX_AVAILABLE and is_intel_cpu():
+            try:
+                pipeline.unet = ipex.optimize(pipeline.unet.eval(), dtype=dtype, inplace=True, weights_prepack=True)
+                pipeline.vae = ipex.optimize(pipeline.vae.eval(), dtype=dtype, inplace=True, weights_prepack=True)
+                optimizations["ipex"] = True
+                logger.info("✅ IPEX optimizations enabled")
+            except Exception as e:
+                logger.warning(f"⚠️ IPEX optimize failed: {e}")
+        
+        # Otherwise try torch compile for faster inference (PyTorch 2.0+)
         try:
-            if hasattr(torch, "compile"):
+            if hasattr(torch, "compile") and not optimizations["ipex"]:
                 pipeline.unet = torch.compile(pipeline.unet, mode="reduce-overhead", fullgraph=True)
                 optimizations["torch_compile"] = True
                 logger.info("✅ Torch compile enabled")
         except Exception as e:
             logger.warning(f"⚠️ Torch compile failed: {e}")
         
-        MODEL_CACHE["pipeline"] = pipeline
+        PIPELINE_CACHE.put(MODEL_ID, pipeline)
         MODEL_CACHE["model_id"] = MODEL_ID
         MODEL_CACHE["device"] = "cpu"
         MODEL_CACHE["optimizations"] = optimizations
@@ -126,19 +266,164 @@ async def load_optimized_model():
         logger.error(f"❌ Failed to load model: {e}")
         raise HTTPException(status_code=500, detail=f"Model loading failed: {str(e)}")
 
+def encode_png(image) -> bytes:
+    """Encode a PIL image as PNG with fast, light compression"""
+    if SPNG_AVAILABLE and image.mode in ("RGB", "RGBA", "L"):
+        return pyspng.encode(np.asarray(image, dtype=np.uint8), compress_level=1)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+def encode_webp(image) -> bytes:
+    """Encode a PIL image as WebP for binary responses"""
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", quality=90, method=2)
+    return buffer.getvalue()
+
+def wants_binary_image(http_request: Request, format: Optional[str]) -> bool:
+    """Binary image unless the client asked for the legacy base64 JSON body"""
+    if format == "base64":
+        return False
+    return http_request.headers.get("accept", "").startswith("image/")
+
+def warmup_compiled_model():
+    """Run each warmup size through the compiled UNet once (compilation depends on shape, not step count)"""
+    pipeline = PIPELINE_CACHE.get(MODEL_ID)
+    for width, height in WARMUP_SIZES:
+        logger.info(f"🔥 Warming up compiled model at {width}x{height}...")
+        with torch.inference_mode():
+            pipeline(
+                prompt="warmup",
+                width=width,
+                height=height,
+                num_inference_steps=2,
+                output_type="latent"
+            )
+
+def run_pipeline(requests: List[ImageRequest]) -> list:
+    """Run one pipeline call for requests sharing size, steps, guidance and negative-prompt presence"""
+    pipeline = PIPELINE_CACHE.get(MODEL_ID)
+    first = requests[0]
+    
+    # Set random seeds (one generator per image so each request stays reproducible)
+    if all(r.seed is None for r in requests):
+        generator = None
+    else:
+        generator = [
+            torch.Generator("cpu").manual_seed(r.seed if r.seed is not None else secrets.randbits(63))
+            for r in requests
+        ]
+        if len(requests) == 1:
+            generator = generator[0]
+    
+    with torch.inference_mode():
+        result = pipeline(
+            prompt=[r.prompt for r in requests] if len(requests) > 1 else first.prompt,
+            negative_prompt=(
+                [r.negative_prompt for r in requests]
+                if len(requests) > 1 and first.negative_prompt is not None
+                else first.negative_prompt
+            ),
+            width=first.width,
+            height=first.height,
+            num_inference_steps=first.steps,
+            guidance_scale=first.guidance_scale,
+            generator=generator,
+            output_type="pil"
+        )
+    return result.images
+
+class GenerationBatcher(AsyncBatcher):
+    """Runs same-shape requests from each batch as a single pipeline call"""
+    
+    def __init__(self, max_batch_size: int = MAX_BATCH, max_wait_ms: int = BATCH_WAIT_MS):
+        super().__init__(max_batch_size, max_wait_ms)
+    
+    @staticmethod
+    def _bucket(request: ImageRequest) -> Tuple:
+        """Requests in the same bucket can run in one pipeline call"""
+        return (
+            request.width,
+            request.height,
+            request.steps,
+            request.guidance_scale,
+            request.negative_prompt is None
+        )
+    
+    async def process_batch(self, items: List[ImageRequest]) -> List[Any]:
+        """Run one pipeline call per bucket, returning each request's (image, inference ms) or exception"""
+        buckets: Dict[Tuple, List[int]] = {}
+        for index, request in enumerate(items):
+            buckets.setdefault(self._bucket(request), []).append(index)
+        
+        results: List[Any] = [None] * len(items)
+        for indices in buckets.values():
+            requests = [items[i] for i in indices]
+            if len(requests) > 1:
+                logger.info(f"📦 Batching {len(requests)} generation requests")
+            start_time = time.perf_counter()
+            try:
+                # Off the event loop, so new requests keep queueing during inference
+                images = await asyncio.to_thread(run_pipeline, requests)
+            except Exception as e:
+                for i in indices:
+                    results[i] = e
+                continue
+            
+            inference_ms = int((time.perf_counter() - start_time) * 1000)
+            for i, image in zip(indices, images):
+                results[i] = (image, inference_ms)
+        
+        return results
+
+BATCHER: Optional[GenerationBatcher] = None
+
+MPS_AVAILABLE = torch.backends.mps.is_available()
+requests_since_cleanup = 0
+
 def cleanup_memory():
     """Clean up memory"""
+    global requests_since_cleanup
+    requests_since_cleanup = 0
     gc.collect()
-    if torch.backends.mps.is_available():
+    if MPS_AVAILABLE:
         torch.mps.empty_cache()
 
+def maybe_cleanup_memory():
+    """Clean up after a generation, but only every CLEANUP_EVERY_N_REQUESTS or when memory is tight"""
+    global requests_since_cleanup
+    requests_since_cleanup += 1
+    if (requests_since_cleanup >= CLEANUP_EVERY_N_REQUESTS
+            or get_memory_info()["percent"] > CLEANUP_MEMORY_PERCENT):
+        cleanup_memory()
+
+def freeze_loaded_objects():
+    """Move everything alive after model load into the permanent GC generation
+    
+    The pipeline holds tens of thousands of objects that never die; frozen,
+    they are no longer traversed by every later collection.
+    """
+    gc.collect()
+    gc.freeze()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan management"""
     logger.info("🚀 Starting GameForge Optimized SDXL Service...")
     await load_optimized_model()
+    if MODEL_CACHE["optimizations"].get("torch_compile"):
+        await asyncio.to_thread(warmup_compiled_model)
+    freeze_loaded_objects()
+    
+    global BATCHER
+    if ENABLE_DYNAMIC_BATCHING:
+        BATCHER = GenerationBatcher()
+        await BATCHER.start()
+        logger.info(f"✅ Dynamic batching enabled (up to {MAX_BATCH} requests, {BATCH_WAIT_MS} ms window)")
     yield
     logger.info("💤 Shutting down service...")
+    if BATCHER:
+        await BATCHER.stop()
     cleanup_memory()
 
 # Create FastAPI app
@@ -146,77 +431,86 @@ app = FastAPI(
     title="GameForge SDXL Optimized Service",
     version="2.1.0",
     description="CPU-optimized SDXL service with model caching and fast inference",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 @app.get("/health")
 async def health():
     """Health check endpoint"""
     memory_info = get_memory_info()
-    models_loaded = "pipeline" in MODEL_CACHE
+    models_loaded = MODEL_ID in PIPELINE_CACHE
     
-    return {
+    return ORJSONResponse({
         "status": "healthy" if models_loaded else "loading",
         "version": "2.1.0",
         "service": "sdxl-optimized",
         "models_loaded": models_loaded,
         "device": "cpu",
         "memory": memory_info
-    }
+    })
 
-@app.get("/model-status", response_model=ModelStatus)
+@app.get("/model-status", responses={200: {"model": ModelStatus}})
 async def get_model_status():
     """Get detailed model status"""
-    if "pipeline" not in MODEL_CACHE:
+    if MODEL_ID not in PIPELINE_CACHE:
         raise HTTPException(status_code=503, detail="Model not loaded yet")
     
     memory_info = get_memory_info()
     
-    return ModelStatus(
-        loaded=True,
-        model_id=MODEL_CACHE["model_id"],
-        device=MODEL_CACHE["device"],
-        memory_usage=memory_info,
-        optimizations=MODEL_CACHE.get("optimizations", {})
-    )
+    return ORJSONResponse({
+        "loaded": True,
+        "model_id": MODEL_CACHE["model_id"],
+        "device": MODEL_CACHE["device"],
+        "memory_usage": memory_info,
+        "optimizations": MODEL_CACHE.get("optimizations", {})
+    })
 
-@app.post("/generate", response_model=ImageResponse)
-async def generate_image(request: ImageRequest, background_tasks: BackgroundTasks):
-    """Generate image using optimized SDXL model"""
+@app.post("/generate", responses={200: {"model": ImageResponse, "content": {"image/webp": {}}}})
+async def generate_image(
+    request: ImageRequest,
+    background_tasks: BackgroundTasks,
+    http_request: Request,
+    format: Optional[str] = None
+):
+    """Generate image using optimized SDXL model
     
-    if "pipeline" not in MODEL_CACHE:
+    Clients sending `Accept: image/*` get the WebP bytes directly with the
+    key metadata in X- headers; `?format=base64` forces the JSON body.
+    """
+    
+    if MODEL_ID not in PIPELINE_CACHE:
         raise HTTPException(status_code=503, detail="Model not loaded yet")
     
     try:
-        pipeline = MODEL_CACHE["pipeline"]
-        
-        # Set random seed
-        generator = torch.Generator("cpu").manual_seed(request.seed) if request.seed is not None else None
-        
         logger.info(f"Generating: '{request.prompt[:50]}...' ({request.width}x{request.height}, {request.steps} steps)")
         
         # Generate image with CPU optimization
-        with torch.inference_mode():
-            result = pipeline(
-                prompt=request.prompt,
-                negative_prompt=request.negative_prompt,
-                width=request.width,
-                height=request.height,
-                num_inference_steps=request.steps,
-                guidance_scale=request.guidance_scale,
-                generator=generator,
-                output_type="pil"
-            )
+        if BATCHER:
+            image, inference_ms = await BATCHER.process(request)
+        else:
+            start_time = time.perf_counter()
+            image = run_pipeline([request])[0]
+            inference_ms = int((time.perf_counter() - start_time) * 1000)
         
-        image = result.images[0]
+        # Schedule cleanup
+        background_tasks.add_task(maybe_cleanup_memory)
         
-        # Convert to base64
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG", optimize=True)
-        img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        if wants_binary_image(http_request, format):
+            headers = {
+                "X-Model": MODEL_CACHE["model_id"],
+                "X-Inference-MS": str(inference_ms)
+            }
+            if request.seed is not None:
+                headers["X-Seed"] = str(request.seed)
+            return Response(
+                content=encode_webp(image),
+                media_type="image/webp",
+                headers=headers
+            )
         
-        # Schedule cleanup
-        background_tasks.add_task(cleanup_memory)
+        # Convert to base64
+        img_base64 = b64encode_str(encode_png(image))
         
         # Create metadata
         metadata = {
@@ -226,6 +520,7 @@ async def generate_image(request: ImageRequest, background_tasks: BackgroundTask
             "height": request.height,
             "steps": request.steps,
             "guidance_scale": request.guidance_scale,
+            "scheduler": "DPM-Solver++ 2M Karras",
             "seed": request.seed,
             "model": MODEL_CACHE["model_id"],
             "device": "cpu",
@@ -236,10 +531,11 @@ async def generate_image(request: ImageRequest, background_tasks: BackgroundTask
         
         logger.info(f"✅ Generated successfully ({len(img_base64)} chars)")
         
-        return ImageResponse(
-            image=img_base64,
-            metadata=metadata
-        )
+        # Plain dict straight to orjson; the base64 image makes jsonable_encoder expensive
+        return ORJSONResponse({
+            "image": img_base64,
+            "metadata": metadata
+        })
         
     except Exception as e:
         logger.error(f"❌ Generation failed: {e}")
@@ -252,12 +548,14 @@ async def reload_model():
     global MODEL_CACHE
     
     logger.info("Reloading model...")
+    gc.unfreeze()  # Let the old pipeline be collected
     MODEL_CACHE.clear()
-    cleanup_memory()
+    PIPELINE_CACHE.clear()
     
     await load_optimized_model()
+    freeze_loaded_objects()
     
-    return {"status": "success", "message": "Model reloaded"}
+    return ORJSONResponse({"status": "success", "message": "Model reloaded"})
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8080))
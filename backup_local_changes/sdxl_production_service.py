@@ -1,31 +1,99 @@
 """
 GameForge SDXL Service - Production Optimized
-Real Stable Diffusion XL with model caching, fp16, and xFormers optimization
+Real Stable Diffusion XL with model caching, fp16, and PyTorch SDPA attention
 """
 
 import os
-import io
-import base64
 import asyncio
+import secrets
 import logging
-from typing import Optional, Dict, Any
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Literal, Tuple, Callable
 from contextlib import asynccontextmanager
 
 import torch
 from fastapi import FastAPI, HTTPException, BackgroundTasks
-from pydantic import BaseModel, Field
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, field_validator, model_validator
 import uvicorn
-from diffusers import StableDiffusionXLPipeline, StableDiffusionXLImg2ImgPipeline
+from diffusers import StableDiffusionXLPipeline, StableDiffusionXLImg2ImgPipeline, LCMScheduler
+from diffusers.models.attention_processor import AttnProcessor2_0
+from PIL import Image
 import gc
 
+from sdxl_common import (
+    ATTENTION_BACKEND, PipelineBatcher, cpu_dtype, encode_image_base64, preview_callback, sdpa_kernels,
+    sse_event
+)
+
+try:
+    from torchao.quantization import quantize_, int8_weight_only, float8_weight_only
+    TORCHAO_AVAILABLE = True
+except ImportError:
+    TORCHAO_AVAILABLE = False
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global variables for model caching
-MODEL_CACHE: Dict[str, Any] = {}
+# Loaded models (see ModelState); None until load_sdxl_models finishes
+MODEL_STATE: Optional["ModelState"] = None
 MODEL_ID = "stabilityai/stable-diffusion-xl-base-1.0"
 REFINER_ID = "stabilityai/stable-diffusion-xl-refiner-1.0"
+LCM_LORA_ID = "latent-consistency/lcm-lora-sdxl"
+
+# Few-step sampling for fast=True requests (LCM-LoRA wants ~4-8 steps and little or no CFG)
+LCM_STEPS = int(os.getenv("LCM_STEPS", "6"))
+LCM_GUIDANCE_SCALE = float(os.getenv("LCM_GUIDANCE_SCALE", "1.0"))
+
+# Held while a call temporarily swaps the base pipeline's scheduler and LoRA state
+PIPELINE_LOCK = threading.Lock()
+
+# Dynamic batching: compatible requests arriving within the window share one UNet forward
+MAX_BATCH = int(os.getenv("MAX_BATCH", "4"))
+BATCH_WINDOW_MS = int(os.getenv("BATCH_WINDOW_MS", "20"))
+BATCHER: Optional[PipelineBatcher] = None
+
+# Held for every pipeline call (batched groups, streaming requests, reloads): they all drive
+# one pipeline, whose scheduler, LoRA and UNet-swap state cannot be shared between threads
+GPU_LOCK = asyncio.Lock()
+
+# The compiled UNet is specialized per shape, so only these sizes are accepted
+ALLOWED_SIZES = (768, 1024, 1216)
+
+# Weight-only quantization of the base UNet: "int8" (A100 and consumer cards), "fp8" (H100) or "none"
+SDXL_QUANTIZE = os.getenv("SDXL_QUANTIZE", "none").lower()
+
+# Replay the base UNet step from captured CUDA graphs instead of launching its kernels one by one;
+# used in place of torch.compile, so setting it skips compilation
+SDXL_CUDAGRAPH = os.getenv("SDXL_CUDAGRAPH", "0") == "1"
+
+# After a generation, collect garbage only every N requests, and hand cached CUDA blocks back
+# only when the allocator is holding this much more than it uses (empty_cache syncs the GPU)
+CLEANUP_EVERY_N_REQUESTS = int(os.getenv("CLEANUP_EVERY_N_REQUESTS", "50"))
+CLEANUP_RESERVED_SLACK_GB = float(os.getenv("CLEANUP_RESERVED_SLACK_GB", "2"))
+requests_since_cleanup = 0
+
+# VRAM a generation may use beyond the resident weights. Requests estimated above it are
+# rejected with a 422 and batches are split to stay under it, instead of OOMing mid-run
+# (which leaves the CUDA context unusable until a restart).
+SDXL_VRAM_BUDGET_GB = float(os.getenv("SDXL_VRAM_BUDGET_GB", "8"))
+# Rough calibration: UNet activations with SDPA per output pixel per image in the
+# (CFG-doubled) batch, and the refiner pass's extra working set
+ACTIVATION_BYTES_PER_PIXEL = 1400
+REFINER_OVERHEAD_BYTES = 1.5e9
+
+def _peak_vram_estimate(width: Optional[int], height: Optional[int], use_refiner: bool, batch_size: int = 1) -> float:
+    """Estimated peak VRAM in bytes beyond the weights; steps only add time, not memory"""
+    pixels = (width or 1024) * (height or 1024)
+    return pixels * 2 * batch_size * ACTIVATION_BYTES_PER_PIXEL + (REFINER_OVERHEAD_BYTES if use_refiner else 0)
+
+def _fits_vram_budget(request: "ImageRequest", batch_size: int) -> bool:
+    """Whether a batch of batch_size requests like this one stays under SDXL_VRAM_BUDGET_GB"""
+    estimate = _peak_vram_estimate(request.width, request.height, bool(request.use_refiner), batch_size)
+    return estimate <= SDXL_VRAM_BUDGET_GB * 1024**3
 
 class ImageRequest(BaseModel):
     prompt: str = Field(..., description="Text prompt for image generation")
@@ -35,7 +103,22 @@ class ImageRequest(BaseModel):
     steps: Optional[int] = Field(25, ge=10, le=100, description="Number of denoising steps")
     guidance_scale: Optional[float] = Field(7.5, ge=1.0, le=20.0, description="CFG scale")
     use_refiner: Optional[bool] = Field(False, description="Use SDXL refiner for higher quality")
+    fast: Optional[bool] = Field(False, description="Few-step LCM-LoRA sampling (ignores steps and guidance_scale)")
     seed: Optional[int] = Field(None, description="Random seed for reproducibility")
+    format: Literal["jpeg", "png"] = Field("jpeg", description="Encoding of the returned image")
+    
+    @field_validator("width", "height")
+    @classmethod
+    def validate_size(cls, v: Optional[int]) -> Optional[int]:
+        if v is not None and v not in ALLOWED_SIZES:
+            raise ValueError(f"Size must be one of {ALLOWED_SIZES}")
+        return v
+    
+    @model_validator(mode="after")
+    def validate_vram_budget(self) -> "ImageRequest":
+        if _peak_vram_estimate(self.width, self.height, bool(self.use_refiner)) > SDXL_VRAM_BUDGET_GB * 1024**3:
+            raise ValueError(f"Request exceeds the {SDXL_VRAM_BUDGET_GB}GB VRAM budget; lower the size or disable the refiner")
+        return self
 
 class ImageResponse(BaseModel):
     image: str = Field(..., description="Base64 encoded image")
@@ -76,11 +159,123 @@ def get_device_info():
             }
         }
 
+class CPUSwapper:
+    """Moves a module's weights between pinned CPU memory and the GPU by swapping state dicts
+    
+    The pinned CPU copy is kept for the module's lifetime, so unloading is just
+    pointing the parameters back at it and loading is one non-blocking copy,
+    instead of the full .to() round trips model CPU offload does on every call.
+    """
+    
+    def __init__(self, module: torch.nn.Module, device: str = "cuda"):
+        self.module = module
+        self.device = device
+        self.cpu_state = {k: v.to("cpu").pin_memory() for k, v in module.state_dict().items()}
+        self.module.load_state_dict(self.cpu_state, assign=True)
+        self.on_gpu = False
+    
+    def load(self):
+        """Copy the weights to the GPU"""
+        if not self.on_gpu:
+            gpu_state = {k: v.to(self.device, non_blocking=True) for k, v in self.cpu_state.items()}
+            self.module.load_state_dict(gpu_state, assign=True)
+            self.on_gpu = True
+    
+    def unload(self):
+        """Point the weights back at the pinned CPU copy, freeing the GPU tensors"""
+        if self.on_gpu:
+            self.module.load_state_dict(self.cpu_state, assign=True)
+            self.on_gpu = False
+
+class GraphedStep:
+    """Replays a UNet forward from a CUDA graph captured once per input shape
+    
+    On the first call for a shape the inputs are copied into persistent
+    buffers, the forward is warmed up on a side stream and then captured;
+    later calls copy their inputs into the same buffers and replay. Calls
+    with arguments the graph cannot represent (timestep_cond, cross-attention
+    kwargs, return_dict) or made while disabled go through the original forward.
+    """
+    
+    def __init__(self, forward):
+        self.forward = forward
+        self.graphs: Dict[Tuple, Tuple[torch.cuda.CUDAGraph, Dict[str, torch.Tensor], torch.Tensor]] = {}
+        self.pool = torch.cuda.graph_pool_handle()  # shared by every captured shape
+        self.enabled = True
+    
+    def __call__(self, sample, timestep, encoder_hidden_states, timestep_cond=None,
+                 cross_attention_kwargs=None, added_cond_kwargs=None, return_dict=True, **kwargs):
+        if (not self.enabled or timestep_cond is not None or cross_attention_kwargs
+                or kwargs or return_dict or not added_cond_kwargs):
+            return self.forward(
+                sample, timestep, encoder_hidden_states, timestep_cond=timestep_cond,
+                cross_attention_kwargs=cross_attention_kwargs, added_cond_kwargs=added_cond_kwargs,
+                return_dict=return_dict, **kwargs
+            )
+        
+        inputs = {
+            "sample": sample,
+            "timestep": torch.as_tensor(timestep, device=sample.device),
+            "encoder_hidden_states": encoder_hidden_states,
+            "text_embeds": added_cond_kwargs["text_embeds"],
+            "time_ids": added_cond_kwargs["time_ids"]
+        }
+        key = tuple((tuple(t.shape), t.dtype) for t in inputs.values())
+        if key not in self.graphs:
+            self.graphs[key] = self._capture(inputs)
+        
+        graph, static_inputs, static_output = self.graphs[key]
+        for name, tensor in inputs.items():
+            static_inputs[name].copy_(tensor)
+        graph.replay()
+        # The next replay overwrites static_output, and some schedulers keep past outputs
+        return (static_output.clone(),)
+    
+    def _run(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        return self.forward(
+            inputs["sample"], inputs["timestep"], inputs["encoder_hidden_states"],
+            added_cond_kwargs={"text_embeds": inputs["text_embeds"], "time_ids": inputs["time_ids"]},
+            return_dict=False
+        )[0]
+    
+    def _capture(self, inputs: Dict[str, torch.Tensor]):
+        """Capture the forward for these input shapes"""
+        logger.info(f"Capturing UNet CUDA graph for sample shape {tuple(inputs['sample'].shape)}")
+        static_inputs = {name: tensor.clone() for name, tensor in inputs.items()}
+        
+        # Warm up on a side stream so lazy initialization stays out of the graph
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(2):
+                self._run(static_inputs)
+        torch.cuda.current_stream().wait_stream(stream)
+        
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph, pool=self.pool):
+            static_output = self._run(static_inputs)
+        return graph, static_inputs, static_output
+
+@dataclass(slots=True)
+class ModelState:
+    """Pipelines loaded by load_sdxl_models and what was applied to them"""
+    base_pipeline: StableDiffusionXLPipeline
+    device: str = "cpu"
+    dtype: torch.dtype = torch.float32
+    optimizations: Dict[str, bool] = field(default_factory=dict)
+    quant: str = "none"
+    refiner_pipeline: Optional[StableDiffusionXLPipeline] = None
+    # LCM-LoRA fast path: scheduler to swap in, and the one to restore afterwards
+    lcm_scheduler: Optional[LCMScheduler] = None
+    default_scheduler: Any = None
+    unet_swappers: Optional[Dict[str, CPUSwapper]] = None
+    unet_graph: Optional[GraphedStep] = None
+
 async def load_sdxl_models():
     """Load and optimize SDXL models with caching"""
-    global MODEL_CACHE
+    global MODEL_STATE
     
-    if "base_pipeline" in MODEL_CACHE:
+    if MODEL_STATE is not None:
         logger.info("Models already loaded from cache")
         return
     
@@ -89,77 +284,188 @@ async def load_sdxl_models():
     try:
         # Determine device and dtype
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        dtype = torch.float16 if device == "cuda" else torch.float32
+        dtype = torch.float16 if device == "cuda" else cpu_dtype()
         
         logger.info(f"Using device: {device}, dtype: {dtype}")
         
-        # Load base pipeline with optimizations
+        if device == "cuda":
+            # Autotune conv algorithms per shape (shapes are fixed by ALLOWED_SIZES) and allow TF32 matmuls
+            torch.backends.cudnn.benchmark = True
+            torch.backends.cuda.matmul.allow_tf32 = True
+        
+        # Load base pipeline with optimizations; low_cpu_mem_usage loads the safetensors
+        # shards without a randomly initialized copy in host RAM. Pipelines only accept
+        # device_map="balanced", so the move to the device stays a separate .to().
         base_pipeline = StableDiffusionXLPipeline.from_pretrained(
             MODEL_ID,
             torch_dtype=dtype,
             use_safetensors=True,
-            variant="fp16" if device == "cuda" else None
-        )
+            variant="fp16" if device == "cuda" else None,
+            low_cpu_mem_usage=True
+        ).to(device)
         
         # Apply optimizations
         optimizations = {
             "fp16": False,
+            "bf16_cpu": False,
+            "sdpa": False,
             "xformers": False,
             "cpu_offload": False,
-            "sequential_cpu_offload": False
+            "sequential_cpu_offload": False,
+            "torch_compile": False,
+            "quant": False,
+            "channels_last": False,
+            "vae_tiling": False,
+            "cuda_graph": False,
+            "lcm": False
         }
         
+        total_memory = torch.cuda.get_device_properties(0).total_memory if device == "cuda" else 0
+        quantize = device == "cuda" and SDXL_QUANTIZE in ("int8", "fp8") and TORCHAO_AVAILABLE
+        if SDXL_QUANTIZE in ("int8", "fp8") and not TORCHAO_AVAILABLE:
+            logger.warning("⚠️ SDXL_QUANTIZE is set but torchao is not installed")
+        swap_unets = False
+        state = ModelState(base_pipeline=base_pipeline, device=device, dtype=dtype, optimizations=optimizations)
+        
+        # LCM-LoRA as a named adapter, disabled unless a request asks for fast sampling; not
+        # fused, since fusing would change the weights every other request uses. peft layers
+        # cannot wrap torchao-quantized linears, so the two are exclusive.
+        if not quantize:
+            try:
+                base_pipeline.load_lora_weights(LCM_LORA_ID, adapter_name="lcm")
+                base_pipeline.disable_lora()
+                state.lcm_scheduler = LCMScheduler.from_config(base_pipeline.scheduler.config)
+                state.default_scheduler = base_pipeline.scheduler
+                optimizations["lcm"] = True
+                logger.info("✅ LCM-LoRA loaded for fast requests")
+            except Exception as e:
+                logger.warning(f"⚠️ LCM-LoRA loading failed: {e}")
+        
         if device == "cuda":
-            # Enable fp16
-            base_pipeline = base_pipeline.to(device, dtype=dtype)
+            # Loaded in fp16 (torch_dtype)
             optimizations["fp16"] = True
             
-            # Try to enable xFormers
-            try:
+            # NHWC maps the UNet and VAE convolutions onto tensor-core kernels without transposes
+            base_pipeline.unet.to(memory_format=torch.channels_last)
+            base_pipeline.vae.to(memory_format=torch.channels_last)
+            optimizations["channels_last"] = True
+            
+            # Decode the latent in overlapping tiles, one image at a time, so the VAE peak
+            # stays flat at the largest allowed size (max(ALLOWED_SIZES)) instead of forcing offload to thrash
+            base_pipeline.vae.enable_tiling()
+            base_pipeline.vae.enable_slicing()
+            optimizations["vae_tiling"] = True
+            
+            # PyTorch's scaled_dot_product_attention (flash / memory-efficient kernels), or
+            # xFormers on older torch
+            if ATTENTION_BACKEND == "sdpa":
+                base_pipeline.unet.set_attn_processor(AttnProcessor2_0())
+                optimizations["sdpa"] = True
+                logger.info("✅ SDPA attention enabled")
+            elif ATTENTION_BACKEND == "xformers":
                 base_pipeline.enable_xformers_memory_efficient_attention()
                 optimizations["xformers"] = True
-                logger.info("✅ xFormers enabled for memory efficiency")
-            except Exception as e:
-                logger.warning(f"⚠️ xFormers not available: {e}")
+                logger.info("✅ xFormers attention enabled")
+            else:
+                logger.info("No fused attention available, using the default attention")
+            
+            # Weight-only quantization of the UNet linears halves (int8) or quarters (fp8 vs fp32)
+            # the weight bytes read per step; the VAE stays fp16, it is precision sensitive
+            if quantize:
+                try:
+                    quantize_(base_pipeline.unet, int8_weight_only() if SDXL_QUANTIZE == "int8" else float8_weight_only())
+                    optimizations["quant"] = True
+                    logger.info(f"✅ UNet quantized to {SDXL_QUANTIZE} (weight-only)")
+                except Exception as e:
+                    logger.warning(f"⚠️ UNet quantization failed: {e}")
+            
+            # Between 12 and 16GB the base and refiner UNets do not both fit, so they take turns
+            # (a quantized base UNet is small enough for both to stay resident)
+            swap_unets = not optimizations["quant"] and 12 * 1024**3 < total_memory < 16 * 1024**3
             
-            # Enable model CPU offload if memory is limited
+            # Enable model CPU offload if even the base model alone is tight (no refiner then);
+            # a quantized UNet fits 12GB cards without it
             try:
-                if torch.cuda.get_device_properties(0).total_memory < 16 * 1024**3:  # < 16GB
+                if total_memory <= 12 * 1024**3 and not optimizations["quant"]:
                     base_pipeline.enable_model_cpu_offload()
                     optimizations["cpu_offload"] = True
                     logger.info("✅ CPU offload enabled for memory optimization")
             except Exception as e:
                 logger.warning(f"⚠️ CPU offload failed: {e}")
+            
+            # Compile the UNet and VAE decoder (fused kernels + CUDA graphs); offloaded or
+            # swapped weights change device between calls, which CUDA graphs cannot follow.
+            # SDXL_CUDAGRAPH opts out of compiling in favour of the explicit graphs below.
+            if (hasattr(torch, "compile") and not SDXL_CUDAGRAPH
+                    and not optimizations["cpu_offload"] and not swap_unets):
+                try:
+                    base_pipeline.unet = torch.compile(base_pipeline.unet, mode="reduce-overhead")
+                    base_pipeline.vae.decoder = torch.compile(base_pipeline.vae.decoder, mode="reduce-overhead")
+                    optimizations["torch_compile"] = True
+                    logger.info("✅ Torch compile enabled")
+                except Exception as e:
+                    logger.warning(f"⚠️ Torch compile failed: {e}")
+            
+            # Explicit CUDA graphs for the UNet step instead of torch.compile (compile's
+            # reduce-overhead mode already graphs it); same offload/swap restriction
+            if SDXL_CUDAGRAPH and not optimizations["torch_compile"] and not optimizations["cpu_offload"] and not swap_unets:
+                state.unet_graph = GraphedStep(base_pipeline.unet.forward)
+                base_pipeline.unet.forward = state.unet_graph
+                optimizations["cuda_graph"] = True
+                logger.info("✅ UNet CUDA graphs enabled")
         else:
-            base_pipeline = base_pipeline.to(device)
-            logger.info("Running on CPU - optimizations limited")
+            # The fp32 weights were cast to bf16 on load (the fp16 variant is only fetched for CUDA)
+            optimizations["bf16_cpu"] = dtype == torch.bfloat16
+            logger.info(f"Running on CPU ({dtype}) - optimizations limited")
         
-        MODEL_CACHE["base_pipeline"] = base_pipeline
-        MODEL_CACHE["device"] = device
-        MODEL_CACHE["dtype"] = dtype
-        MODEL_CACHE["optimizations"] = optimizations
+        state.quant = SDXL_QUANTIZE if optimizations["quant"] else "none"
         
         logger.info("✅ SDXL base model loaded and optimized successfully")
         
         # Optional: Load refiner (memory permitting)
-        if device == "cuda" and torch.cuda.get_device_properties(0).total_memory > 12 * 1024**3:
+        if device == "cuda" and total_memory > 12 * 1024**3:
             try:
                 logger.info("Loading SDXL refiner model...")
                 refiner_pipeline = StableDiffusionXLPipeline.from_pretrained(
                     REFINER_ID,
                     torch_dtype=dtype,
                     use_safetensors=True,
-                    variant="fp16"
+                    variant="fp16",
+                    low_cpu_mem_usage=True
                 )
-                refiner_pipeline = refiner_pipeline.to(device)
-                if optimizations["xformers"]:
+                if swap_unets:
+                    # Refiner UNet stays in pinned CPU memory until a refine pass needs it
+                    state.unet_swappers = {
+                        "base": CPUSwapper(base_pipeline.unet, device),
+                        "refiner": CPUSwapper(refiner_pipeline.unet, device)
+                    }
+                    state.unet_swappers["base"].load()
+                    for name, component in refiner_pipeline.components.items():
+                        if isinstance(component, torch.nn.Module) and name != "unet":
+                            component.to(device)
+                    optimizations["cpu_offload"] = True
+                    logger.info("✅ Base/refiner UNet swapping enabled for memory optimization")
+                else:
+                    refiner_pipeline = refiner_pipeline.to(device)
+                refiner_pipeline.unet.to(memory_format=torch.channels_last)
+                refiner_pipeline.vae.to(memory_format=torch.channels_last)
+                refiner_pipeline.vae.enable_tiling()
+                refiner_pipeline.vae.enable_slicing()
+                if optimizations["sdpa"]:
+                    refiner_pipeline.unet.set_attn_processor(AttnProcessor2_0())
+                elif optimizations["xformers"]:
                     refiner_pipeline.enable_xformers_memory_efficient_attention()
+                if optimizations["torch_compile"]:
+                    refiner_pipeline.unet = torch.compile(refiner_pipeline.unet, mode="reduce-overhead")
                 
-                MODEL_CACHE["refiner_pipeline"] = refiner_pipeline
+                state.refiner_pipeline = refiner_pipeline
                 logger.info("✅ SDXL refiner model loaded")
             except Exception as e:
                 logger.warning(f"⚠️ Refiner loading failed: {e}")
         
+        # Published only once fully loaded, so requests never see a partial state
+        MODEL_STATE = state
+        
         # Log memory usage
         device_info = get_device_info()
         logger.info(f"Memory usage: {device_info['memory']}")
@@ -168,19 +474,184 @@ async def load_sdxl_models():
         logger.error(f"❌ Failed to load SDXL models: {e}")
         raise HTTPException(status_code=500, detail=f"Model loading failed: {str(e)}")
 
+def _batch_key(request: ImageRequest) -> Tuple:
+    """Parameters that must match for requests to share a pipeline call"""
+    return (
+        request.width,
+        request.height,
+        request.steps,
+        request.guidance_scale,
+        request.use_refiner,
+        bool(request.fast),
+        request.negative_prompt is None
+    )
+
+@lru_cache(maxsize=256)
+def _encode(text: str, pipeline_id: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """(prompt_embeds, pooled_prompt_embeds) for one prompt from the base pipeline's text encoders
+    
+    Cached, since most requests repeat the same negative prompt and many repeat
+    prompts; pipeline_id keys entries to the pipeline instance that encoded them.
+    """
+    pipeline = MODEL_STATE.base_pipeline
+    prompt_embeds, _, pooled_prompt_embeds, _ = pipeline.encode_prompt(
+        prompt=text,
+        device=pipeline._execution_device,
+        num_images_per_prompt=1,
+        do_classifier_free_guidance=False
+    )
+    return prompt_embeds, pooled_prompt_embeds
+
+def _encode_batch(texts: List[str], pipeline_id: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Cached embeddings for each text, concatenated along the batch dimension"""
+    encoded = [_encode(text, pipeline_id) for text in texts]
+    return torch.cat([e[0] for e in encoded]), torch.cat([e[1] for e in encoded])
+
+def generate_batch(
+    requests: List[ImageRequest],
+    on_preview: Optional[Callable[[int, Image.Image], None]] = None
+) -> List[Image.Image]:
+    """Generate one image per request with a single base (and refiner) pipeline call
+    
+    on_preview, if given, receives (step, preview image) during the base pass.
+    """
+    state = MODEL_STATE
+    pipeline = state.base_pipeline
+    device = state.device
+    first = requests[0]
+    
+    # Set random seeds, one generator per image so each request stays reproducible
+    generator = None
+    if any(r.seed is not None for r in requests):
+        generator = [
+            torch.Generator(device=device).manual_seed(r.seed if r.seed is not None else secrets.randbits(63))
+            for r in requests
+        ]
+    
+    prompts = [r.prompt for r in requests]
+    negative_prompts = None if first.negative_prompt is None else [r.negative_prompt for r in requests]
+    
+    # Fast requests: LCM scheduler + LoRA with few steps, restored for the next call
+    fast = first.fast and state.lcm_scheduler is not None
+    steps = LCM_STEPS if fast else first.steps
+    guidance_scale = LCM_GUIDANCE_SCALE if fast else first.guidance_scale
+    
+    # Generate base images
+    graphed = state.unet_graph
+    with PIPELINE_LOCK, torch.inference_mode(), sdpa_kernels(device):
+        if fast:
+            pipeline.scheduler = state.lcm_scheduler
+            pipeline.enable_lora()
+            if graphed:
+                # Captured graphs were recorded without the LoRA layers
+                graphed.enabled = False
+        
+        try:
+            prompt_embeds, pooled_prompt_embeds = _encode_batch(prompts, id(pipeline))
+            if negative_prompts is None and pipeline.config.force_zeros_for_empty_prompt:
+                # What the pipeline itself does for a missing negative prompt
+                negative_prompt_embeds = torch.zeros_like(prompt_embeds)
+                negative_pooled_prompt_embeds = torch.zeros_like(pooled_prompt_embeds)
+            else:
+                negative_prompt_embeds, negative_pooled_prompt_embeds = _encode_batch(
+                    negative_prompts or [""] * len(prompts), id(pipeline)
+                )
+            
+            images = pipeline(
+                prompt_embeds=prompt_embeds,
+                pooled_prompt_embeds=pooled_prompt_embeds,
+                negative_prompt_embeds=negative_prompt_embeds,
+                negative_pooled_prompt_embeds=negative_pooled_prompt_embeds,
+                width=first.width,
+                height=first.height,
+                num_inference_steps=steps,
+                guidance_scale=guidance_scale,
+                generator=generator,
+                output_type="pil",
+                callback_on_step_end=preview_callback(on_preview) if on_preview else None
+            ).images
+        finally:
+            if fast:
+                pipeline.scheduler = state.default_scheduler
+                pipeline.disable_lora()
+                if graphed:
+                    graphed.enabled = True
+    
+    # Optional refiner pass
+    if first.use_refiner and state.refiner_pipeline is not None:
+        logger.info("Applying refiner for enhanced quality...")
+        refiner = state.refiner_pipeline
+        refiner_steps = max(10, first.steps // 2) if first.steps else 15
+        swappers = state.unet_swappers
+        if swappers:
+            swappers["base"].unload()
+            swappers["refiner"].load()
+        try:
+            with torch.inference_mode(), sdpa_kernels(device):
+                images = refiner(
+                    prompt=prompts,
+                    negative_prompt=negative_prompts,
+                    image=images,
+                    num_inference_steps=refiner_steps,
+                    denoising_start=0.8,
+                    generator=generator
+                ).images
+        finally:
+            if swappers:
+                swappers["refiner"].unload()
+                swappers["base"].load()
+    
+    return images
+
+def warmup_compiled_models():
+    """Run a short generation so compilation happens at startup, not on the first request"""
+    logger.info("🔥 Warming up compiled UNet (first compile takes about a minute)...")
+    with torch.inference_mode(), sdpa_kernels(MODEL_STATE.device):
+        MODEL_STATE.base_pipeline(
+            prompt="warmup",
+            num_inference_steps=2,
+            width=1024,
+            height=1024
+        )
+
 def cleanup_memory():
-    """Clean up GPU memory"""
+    """Clean up GPU memory (full reset, for errors, reloads and shutdown)"""
     if torch.cuda.is_available():
         torch.cuda.empty_cache()
         gc.collect()
 
+def maybe_cleanup_memory():
+    """Clean up after a generation, leaving the caching allocator alone unless it holds a lot of slack"""
+    global requests_since_cleanup
+    requests_since_cleanup += 1
+    if requests_since_cleanup >= CLEANUP_EVERY_N_REQUESTS:
+        requests_since_cleanup = 0
+        gc.collect()
+    if torch.cuda.is_available():
+        slack = torch.cuda.memory_reserved() - torch.cuda.memory_allocated()
+        if slack > CLEANUP_RESERVED_SLACK_GB * 1024**3:
+            torch.cuda.empty_cache()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan - load models on startup"""
+    global BATCHER
     logger.info("🚀 Starting GameForge SDXL Service...")
     await load_sdxl_models()
+    if MODEL_STATE.optimizations["torch_compile"]:
+        await asyncio.to_thread(warmup_compiled_models)
+    BATCHER = PipelineBatcher(
+        generate_batch,
+        _batch_key,
+        max_batch_size=MAX_BATCH,
+        max_wait_ms=BATCH_WINDOW_MS,
+        gpu_lock=GPU_LOCK,
+        fits=_fits_vram_budget
+    )
+    await BATCHER.start()
     yield
     logger.info("💤 Shutting down GameForge SDXL Service...")
+    await BATCHER.stop()
     cleanup_memory()
 
 # Create FastAPI app with lifespan
@@ -195,7 +666,7 @@ app = FastAPI(
 async def health():
     """Health check endpoint"""
     device_info = get_device_info()
-    models_loaded = len(MODEL_CACHE) > 0
+    models_loaded = MODEL_STATE is not None
     
     return {
         "status": "healthy" if models_loaded else "loading",
@@ -209,7 +680,8 @@ async def health():
 @app.get("/model-status", response_model=ModelStatus)
 async def get_model_status():
     """Get detailed model status and optimization info"""
-    if not MODEL_CACHE:
+    state = MODEL_STATE
+    if state is None:
         raise HTTPException(status_code=503, detail="Models not loaded yet")
     
     device_info = get_device_info()
@@ -217,82 +689,51 @@ async def get_model_status():
     return ModelStatus(
         loaded=True,
         model_id=MODEL_ID,
-        device=MODEL_CACHE.get("device", "unknown"),
+        device=state.device,
         memory_usage=device_info["memory"],
-        optimizations=MODEL_CACHE.get("optimizations", {})
+        optimizations=state.optimizations
     )
 
+def build_metadata(request: ImageRequest) -> Dict[str, Any]:
+    """Generation metadata returned alongside an image"""
+    state = MODEL_STATE
+    return {
+        "prompt": request.prompt,
+        "negative_prompt": request.negative_prompt,
+        "width": request.width,
+        "height": request.height,
+        "steps": request.steps,
+        "guidance_scale": request.guidance_scale,
+        "seed": request.seed,
+        "use_refiner": request.use_refiner,
+        "fast": bool(request.fast and state.lcm_scheduler is not None),
+        "model": MODEL_ID,
+        "device": state.device,
+        "optimizations": state.optimizations,
+        "format": request.format.upper()
+    }
+
 @app.post("/generate", response_model=ImageResponse)
 async def generate_image(request: ImageRequest, background_tasks: BackgroundTasks):
     """Generate image using Stable Diffusion XL"""
     
-    if "base_pipeline" not in MODEL_CACHE:
+    if MODEL_STATE is None:
         raise HTTPException(status_code=503, detail="SDXL model not loaded yet")
     
     try:
-        pipeline = MODEL_CACHE["base_pipeline"]
-        device = MODEL_CACHE["device"]
-        
-        # Set random seed if provided
-        generator = None
-        if request.seed is not None:
-            generator = torch.Generator(device=device).manual_seed(request.seed)
-        
         logger.info(f"Generating image: '{request.prompt[:50]}...' ({request.width}x{request.height})")
         
-        # Generate base image
-        with torch.inference_mode():
-            result = pipeline(
-                prompt=request.prompt,
-                negative_prompt=request.negative_prompt,
-                width=request.width,
-                height=request.height,
-                num_inference_steps=request.steps,
-                guidance_scale=request.guidance_scale,
-                generator=generator,
-                output_type="pil"
-            )
+        # Generate (sharing a batched pipeline call with compatible concurrent requests)
+        image = await BATCHER.process(request)
         
-        image = result.images[0]
-        
-        # Optional refiner pass
-        if request.use_refiner and "refiner_pipeline" in MODEL_CACHE:
-            logger.info("Applying refiner for enhanced quality...")
-            refiner = MODEL_CACHE["refiner_pipeline"]
-            refiner_steps = max(10, request.steps // 2) if request.steps else 15
-            with torch.inference_mode():
-                image = refiner(
-                    prompt=request.prompt,
-                    negative_prompt=request.negative_prompt,
-                    image=image,
-                    num_inference_steps=refiner_steps,
-                    denoising_start=0.8,
-                    generator=generator
-                ).images[0]
-        
-        # Convert to base64
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG", quality=95)
-        img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        # Encode and base64 (CPU-bound, so off the event loop)
+        img_base64 = await asyncio.to_thread(encode_image_base64, image, request.format)
         
         # Schedule memory cleanup
-        background_tasks.add_task(cleanup_memory)
+        background_tasks.add_task(maybe_cleanup_memory)
         
         # Generate metadata
-        metadata = {
-            "prompt": request.prompt,
-            "negative_prompt": request.negative_prompt,
-            "width": request.width,
-            "height": request.height,
-            "steps": request.steps,
-            "guidance_scale": request.guidance_scale,
-            "seed": request.seed,
-            "use_refiner": request.use_refiner,
-            "model": MODEL_ID,
-            "device": device,
-            "optimizations": MODEL_CACHE.get("optimizations", {}),
-            "format": "PNG"
-        }
+        metadata = build_metadata(request)
         
         logger.info(f"✅ Image generated successfully ({len(img_base64)} chars)")
         
@@ -306,18 +747,65 @@ async def generate_image(request: ImageRequest, background_tasks: BackgroundTask
         cleanup_memory()  # Clean up on error
         raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
 
+@app.post("/generate/stream")
+async def generate_image_stream(request: ImageRequest):
+    """Generate an image, streaming low-res previews as Server-Sent Events
+    
+    Emits "preview" events ({"step", "image"}, base64 JPEG) while denoising,
+    then one "complete" event with the ImageResponse fields, or "error".
+    Runs as its own pipeline call rather than joining a batch.
+    """
+    
+    if MODEL_STATE is None:
+        raise HTTPException(status_code=503, detail="SDXL model not loaded yet")
+    
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    
+    def on_preview(step: int, preview: Image.Image):
+        # Called from the inference thread
+        frame = sse_event("preview", {"step": step, "image": encode_image_base64(preview, "jpeg")})
+        loop.call_soon_threadsafe(events.put_nowait, frame)
+    
+    async def run():
+        try:
+            async with GPU_LOCK:
+                images = await asyncio.to_thread(generate_batch, [request], on_preview)
+            img_base64 = await asyncio.to_thread(encode_image_base64, images[0], request.format)
+            await events.put(sse_event("complete", {"image": img_base64, "metadata": build_metadata(request)}))
+        except Exception as e:
+            logger.error(f"❌ Streaming generation failed: {e}")
+            cleanup_memory()
+            await events.put(sse_event("error", {"detail": f"Generation failed: {str(e)}"}))
+        finally:
+            await events.put(None)
+    
+    async def stream():
+        task = asyncio.create_task(run())
+        while (frame := await events.get()) is not None:
+            yield frame
+        await task
+    
+    logger.info(f"Streaming image: '{request.prompt[:50]}...' ({request.width}x{request.height})")
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
 @app.post("/reload-models")
 async def reload_models():
     """Reload models (admin endpoint)"""
-    global MODEL_CACHE
+    global MODEL_STATE
     logger.info("Reloading models...")
     
-    # Clear cache
-    MODEL_CACHE.clear()
-    cleanup_memory()
-    
-    # Reload models
-    await load_sdxl_models()
+    # Wait for the in-flight pipeline call so it never sees the models being replaced
+    async with GPU_LOCK:
+        # Clear cache
+        MODEL_STATE = None
+        _encode.cache_clear()
+        cleanup_memory()
+        
+        # Reload models
+        await load_sdxl_models()
+        if MODEL_STATE.optimizations["torch_compile"]:
+            await asyncio.to_thread(warmup_compiled_models)
     
     return {"status": "success", "message": "Models reloaded"}
 
@@ -5,17 +5,23 @@ GPU-enabled FastAPI service for Stable Diffusion XL image generation
 
 import os
 import sys
+import asyncio
+import secrets
 import torch
 import logging
-from typing import Optional, List
+from typing import Optional, List, Literal, Tuple, Dict, Any, Callable
 from fastapi import FastAPI, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from diffusers import StableDiffusionXLPipeline
-import io
-import base64
+from diffusers.models.attention_processor import AttnProcessor2_0
 from PIL import Image
 
+from sdxl_common import (
+    ATTENTION_BACKEND, PipelineBatcher, cpu_dtype, encode_image_base64, preview_callback, sdpa_kernels,
+    sse_event
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -34,6 +40,15 @@ app = FastAPI(
 pipeline = None
 device = None
 
+# Dynamic batching: compatible requests arriving within the window share one UNet forward
+MAX_BATCH = int(os.getenv("MAX_BATCH", "4"))
+BATCH_WINDOW_MS = int(os.getenv("BATCH_WINDOW_MS", "20"))
+batcher: Optional[PipelineBatcher] = None
+
+# Held for every pipeline call (batched groups, streaming requests, reloads): they all drive
+# one pipeline, whose scheduler, LoRA and UNet-swap state cannot be shared between threads
+GPU_LOCK = asyncio.Lock()
+
 # Request models
 class ImageGenerationRequest(BaseModel):
     prompt: str
@@ -43,6 +58,7 @@ class ImageGenerationRequest(BaseModel):
     num_inference_steps: int = 20
     guidance_scale: float = 7.5
     seed: Optional[int] = None
+    format: Literal["jpeg", "png"] = "jpeg"
 
 class ImageGenerationResponse(BaseModel):
     success: bool
@@ -50,6 +66,47 @@ class ImageGenerationResponse(BaseModel):
     error: Optional[str] = None
     metadata: dict = {}
 
+def _batch_key(request: ImageGenerationRequest) -> Tuple:
+    """Parameters that must match for requests to share a pipeline call"""
+    return (
+        request.width,
+        request.height,
+        request.num_inference_steps,
+        request.guidance_scale,
+        request.negative_prompt is None
+    )
+
+def generate_batch(
+    requests: List[ImageGenerationRequest],
+    on_preview: Optional[Callable[[int, Image.Image], None]] = None
+) -> List[Image.Image]:
+    """Generate one image per request with a single pipeline call
+    
+    on_preview, if given, receives (step, preview image) while denoising.
+    """
+    first = requests[0]
+    
+    # One generator per image so each seeded request stays reproducible within a batch
+    generator = None
+    if any(r.seed is not None for r in requests):
+        generator = [
+            torch.Generator(device=device).manual_seed(r.seed if r.seed is not None else secrets.randbits(63))
+            for r in requests
+        ]
+    
+    # The pipeline is already loaded in the target dtype, so autocast would only add casts
+    with torch.inference_mode(), sdpa_kernels(device):
+        return pipeline(
+            prompt=[r.prompt for r in requests],
+            negative_prompt=None if first.negative_prompt is None else [r.negative_prompt for r in requests],
+            width=first.width,
+            height=first.height,
+            num_inference_steps=first.num_inference_steps,
+            guidance_scale=first.guidance_scale,
+            generator=generator,
+            callback_on_step_end=preview_callback(on_preview) if on_preview else None,
+        ).images
+
 def initialize_pipeline():
     """Initialize the SDXL pipeline with GPU support"""
     global pipeline, device
@@ -59,41 +116,58 @@ def initialize_pipeline():
         if torch.cuda.is_available():
             device = "cuda"
             logger.info(f"CUDA available. Using GPU: {torch.cuda.get_device_name()}")
+            
+            # Autotune conv algorithms per shape and allow TF32 matmuls
+            torch.backends.cudnn.benchmark = True
+            torch.backends.cuda.matmul.allow_tf32 = True
         else:
             device = "cpu"
             logger.warning("CUDA not available. Using CPU (will be slow)")
         
+        # fp16 weights on the GPU; bf16 (cast from the fp32 weights on load) or fp32 on the CPU
+        dtype = torch.float16 if device == "cuda" else cpu_dtype()
+        logger.info(f"Using dtype: {dtype}")
+        
         # Model path - can be local or HuggingFace model ID
         model_path = os.getenv("MODEL_PATH", "/app/models/stable-diffusion-xl-base-1.0")
         
-        # Try to load local model first, fallback to HuggingFace
+        # Try to load local model first, fallback to HuggingFace; low_cpu_mem_usage loads the
+        # safetensors shards without a randomly initialized copy in host RAM
         if os.path.exists(model_path):
             logger.info(f"Loading local model from: {model_path}")
             pipeline = StableDiffusionXLPipeline.from_pretrained(
                 model_path,
-                torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+                torch_dtype=dtype,
                 use_safetensors=True,
-                variant="fp16" if device == "cuda" else None
+                variant="fp16" if device == "cuda" else None,
+                low_cpu_mem_usage=True
             )
         else:
             logger.info("Loading model from HuggingFace Hub")
             pipeline = StableDiffusionXLPipeline.from_pretrained(
                 "stabilityai/stable-diffusion-xl-base-1.0",
-                torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+                torch_dtype=dtype,
                 use_safetensors=True,
-                variant="fp16" if device == "cuda" else None
+                variant="fp16" if device == "cuda" else None,
+                low_cpu_mem_usage=True
             )
         
-        # Move pipeline to device
+        # Move pipeline to device (pipelines only accept device_map="balanced")
         pipeline = pipeline.to(device)
         
-        # Enable memory efficient attention if using GPU
+        # NHWC maps the UNet and VAE convolutions onto tensor-core kernels without transposes
         if device == "cuda":
-            try:
-                pipeline.enable_xformers_memory_efficient_attention()
-                logger.info("XFormers memory efficient attention enabled")
-            except Exception as e:
-                logger.warning(f"Could not enable XFormers: {e}")
+            pipeline.unet.to(memory_format=torch.channels_last)
+            pipeline.vae.to(memory_format=torch.channels_last)
+        
+        # Use PyTorch's scaled_dot_product_attention (flash / memory-efficient kernels on GPU),
+        # or xFormers on older torch
+        if device == "cuda" and ATTENTION_BACKEND == "sdpa":
+            pipeline.unet.set_attn_processor(AttnProcessor2_0())
+            logger.info("SDPA attention enabled")
+        elif device == "cuda" and ATTENTION_BACKEND == "xformers":
+            pipeline.enable_xformers_memory_efficient_attention()
+            logger.info("xFormers attention enabled")
         
         logger.info("SDXL Pipeline initialized successfully")
         return True
@@ -110,6 +184,16 @@ async def startup_event():
     if not success:
         logger.error("Failed to initialize SDXL pipeline")
         sys.exit(1)
+    
+    global batcher
+    batcher = PipelineBatcher(
+        generate_batch,
+        _batch_key,
+        max_batch_size=MAX_BATCH,
+        max_wait_ms=BATCH_WINDOW_MS,
+        gpu_lock=GPU_LOCK
+    )
+    await batcher.start()
 
 @app.get("/")
 async def root():
@@ -136,6 +220,18 @@ async def health_check():
     
     return status
 
+def build_metadata(request: ImageGenerationRequest) -> Dict[str, Any]:
+    """Generation metadata returned alongside an image"""
+    return {
+        "width": request.width,
+        "height": request.height,
+        "steps": request.num_inference_steps,
+        "guidance_scale": request.guidance_scale,
+        "seed": request.seed,
+        "device": device,
+        "format": request.format.upper()
+    }
+
 @app.post("/generate", response_model=ImageGenerationResponse)
 async def generate_image(request: ImageGenerationRequest):
     """Generate an image using SDXL"""
@@ -147,39 +243,18 @@ async def generate_image(request: ImageGenerationRequest):
     try:
         logger.info(f"Generating image with prompt: {request.prompt[:50]}...")
         
-        # Set seed for reproducibility
-        if request.seed is not None:
-            torch.manual_seed(request.seed)
-        
-        # Generate image
-        with torch.autocast(device):
-            image = pipeline(
-                prompt=request.prompt,
-                negative_prompt=request.negative_prompt,
-                width=request.width,
-                height=request.height,
-                num_inference_steps=request.num_inference_steps,
-                guidance_scale=request.guidance_scale,
-            ).images[0]
+        # Generate image (sharing a batched pipeline call with compatible concurrent requests)
+        image = await batcher.process(request)
         
-        # Convert image to base64
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
+        # Encode and base64 (CPU-bound, so off the event loop)
+        image_base64 = await asyncio.to_thread(encode_image_base64, image, request.format)
         
         logger.info("Image generated successfully")
         
         return ImageGenerationResponse(
             success=True,
             image_base64=image_base64,
-            metadata={
-                "width": request.width,
-                "height": request.height,
-                "steps": request.num_inference_steps,
-                "guidance_scale": request.guidance_scale,
-                "seed": request.seed,
-                "device": device
-            }
+            metadata=build_metadata(request)
         )
         
     except Exception as e:
@@ -189,6 +264,45 @@ async def generate_image(request: ImageGenerationRequest):
             error=str(e)
         )
 
+@app.post("/generate/stream")
+async def generate_image_stream(request: ImageGenerationRequest):
+    """Generate an image, streaming low-res previews as Server-Sent Events
+    
+    Emits "preview" events ({"step", "image"}, base64 JPEG) while denoising,
+    then one "complete" event with the ImageGenerationResponse fields.
+    """
+    if pipeline is None:
+        raise HTTPException(status_code=503, detail="Pipeline not initialized")
+    
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    
+    def on_preview(step: int, preview: Image.Image):
+        # Called from the inference thread
+        frame = sse_event("preview", {"step": step, "image": encode_image_base64(preview, "jpeg")})
+        loop.call_soon_threadsafe(events.put_nowait, frame)
+    
+    async def run():
+        try:
+            async with GPU_LOCK:
+                images = await asyncio.to_thread(generate_batch, [request], on_preview)
+            image_base64 = await asyncio.to_thread(encode_image_base64, images[0], request.format)
+            response = ImageGenerationResponse(success=True, image_base64=image_base64, metadata=build_metadata(request))
+        except Exception as e:
+            logger.error(f"Error generating image: {e}")
+            response = ImageGenerationResponse(success=False, error=str(e))
+        await events.put(sse_event("complete", response.model_dump()))
+        await events.put(None)
+    
+    async def stream():
+        task = asyncio.create_task(run())
+        while (frame := await events.get()) is not None:
+            yield frame
+        await task
+    
+    logger.info(f"Streaming image with prompt: {request.prompt[:50]}...")
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
 @app.get("/models")
 async def list_models():
     """List available models"""
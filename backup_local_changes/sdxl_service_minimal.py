@@ -4,15 +4,17 @@ Lightweight FastAPI service for testing ECS deployment
 """
 
 import os
+import asyncio
 import logging
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Literal
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import base64
-import io
 from PIL import Image, ImageDraw
 
+from sdxl_common import encode_image_base64
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,11 +26,16 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Background surface cropped for each placeholder, and the pool that renders them off the event loop
+_TEMPLATE = Image.new('RGB', (2048, 2048), color='lightblue')
+_RENDER_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="render")
+
 # Request models
 class ImageGenerationRequest(BaseModel):
     prompt: str
     width: int = 512
     height: int = 512
+    format: Literal["jpeg", "png"] = "jpeg"
 
 class ImageGenerationResponse(BaseModel):
     success: bool
@@ -36,6 +43,21 @@ class ImageGenerationResponse(BaseModel):
     error: Optional[str] = None
     metadata: dict = {}
 
+def _render(prompt: str, width: int, height: int, format: str) -> str:
+    """Draw the placeholder image and return it encoded and base64'd"""
+    if width <= _TEMPLATE.width and height <= _TEMPLATE.height:
+        image = _TEMPLATE.crop((0, 0, width, height))
+    else:
+        image = Image.new('RGB', (width, height), color='lightblue')
+    draw = ImageDraw.Draw(image)
+    
+    # Add text to the image
+    draw.text((10, 10), f"Prompt: {prompt[:30]}...", fill='darkblue')
+    draw.text((10, 30), f"Size: {width}x{height}", fill='darkblue')
+    draw.text((10, 50), "SDXL Service Ready", fill='darkgreen')
+    
+    return encode_image_base64(image, format)
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -60,20 +82,10 @@ async def generate_image(request: ImageGenerationRequest):
     try:
         logger.info(f"Generating placeholder image: {request.prompt[:50]}...")
         
-        # Create a simple placeholder image
-        image = Image.new('RGB', (request.width, request.height), color='lightblue')
-        draw = ImageDraw.Draw(image)
-        
-        # Add text to the image
-        text = f"Prompt: {request.prompt[:30]}..."
-        draw.text((10, 10), text, fill='darkblue')
-        draw.text((10, 30), f"Size: {request.width}x{request.height}", fill='darkblue')
-        draw.text((10, 50), "SDXL Service Ready", fill='darkgreen')
-        
-        # Convert to base64
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        image_base64 = base64.b64encode(buffer.getvalue()).decode()
+        # Draw, encode and base64 the placeholder in the render pool
+        image_base64 = await asyncio.get_running_loop().run_in_executor(
+            _RENDER_EXECUTOR, _render, request.prompt, request.width, request.height, request.format
+        )
         
         logger.info("Placeholder image generated successfully")
         
@@ -84,7 +96,8 @@ async def generate_image(request: ImageGenerationRequest):
                 "width": request.width,
                 "height": request.height,
                 "type": "placeholder",
-                "service": "minimal"
+                "service": "minimal",
+                "format": request.format.upper()
             }
         )
         
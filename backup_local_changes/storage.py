@@ -12,10 +12,12 @@ import io
 
 from fastapi import UploadFile
 from config import Settings
-from models import GeneratedAsset
+from models import GeneratedAssetStruct
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Stream uploads to disk 1 MiB at a time
+
 class StorageManager:
     """Manages file storage for generated assets and reference images"""
     
@@ -55,7 +57,7 @@ class StorageManager:
             logger.error(f"❌ Failed to initialize storage: {e}")
             raise
     
-    async def save_generated_asset(self, asset: GeneratedAsset) -> GeneratedAsset:
+    async def save_generated_asset(self, asset: GeneratedAssetStruct) -> GeneratedAssetStruct:
         """Save a generated asset to storage"""
         try:
             # Get the processed image from the asset (added by AI pipeline)
@@ -110,10 +112,10 @@ class StorageManager:
             
             file_path = self.references_dir / filename
             
-            # Save file
+            # Save file in chunks instead of buffering the whole upload
             async with aiofiles.open(file_path, 'wb') as f:
-                content = await upload_file.read()
-                await f.write(content)
+                while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+                    await f.write(chunk)
             
             # Validate it's a valid image
             try:
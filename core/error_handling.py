@@ -1,21 +1,75 @@
 # Centralized Error Handling System
 # Phase 1: Core Engine Stabilization - Error Handling Fix
 
+import array
+import atexit
+import gc
 import logging
+import queue
+import reprlib
 import traceback
 import sys
+import threading
 import asyncio
 import json
 import time
-from typing import Dict, List, Optional, Any, Callable, Type, Union
+from typing import Dict, List, Optional, Any, Callable, Type, Union, Tuple
 from datetime import datetime, timedelta
 from contextlib import contextmanager, asynccontextmanager
 from functools import wraps
+from logging.handlers import QueueHandler, QueueListener
 from enum import Enum
 import redis.asyncio as redis
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 import uuid
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_default(value: Any) -> Any:
+    """Encode what the stdlib json module cannot, the way orjson does"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    """JSON-encode a payload (orjson when installed), falling back to str() for unknown types"""
+    if orjson is not None:
+        return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(data, default=_json_default)
+
+
+# torch, imported on the first GPU memory error rather than at startup; None if unavailable
+_torch = None
+_torch_checked = False
+
+
+def _get_torch():
+    """torch module (or None), imported once and cached"""
+    global _torch, _torch_checked
+    if not _torch_checked:
+        try:
+            import torch
+            _torch = torch
+        except ImportError:
+            _torch = None
+        _torch_checked = True
+    return _torch
+
+
+# Bounded repr for the arguments of failed calls: str(args)[:200] would render the whole
+# tuple (tensors, dataframes, ...) before slicing it
+_ARGS_REPR = reprlib.Repr()
+_ARGS_REPR.maxstring = 200
+_ARGS_REPR.maxother = 200
+_ARGS_REPR.maxlist = _ARGS_REPR.maxtuple = _ARGS_REPR.maxdict = 4
+
 
 class ErrorSeverity(Enum):
     """Error severity levels"""
@@ -40,6 +94,19 @@ class ErrorCategory(Enum):
     UNKNOWN = "unknown"
 
 
+# Position of each category in the per-category circuit breaker arrays
+_CATEGORY_INDEX = {category: i for i, category in enumerate(ErrorCategory)}
+
+# Log labels per enum member, built once instead of per formatted message
+_SEV_UPPER = {severity: severity.value.upper() for severity in ErrorSeverity}
+_CAT_STR = {category: category.value for category in ErrorCategory}
+
+CIRCUIT_BREAKER_THRESHOLD = 5  # Failures before the breaker opens
+CIRCUIT_BREAKER_RESET_SECONDS = 300  # 5 minutes without failures closes it again
+
+ERROR_SPIKE_THRESHOLD = 10  # Errors of the same type per hour before warning
+
+
 @dataclass
 class ErrorContext:
     """Error context information"""
@@ -62,6 +129,33 @@ class ErrorContext:
             self.metadata = {}
 
 
+# Redis keys. The {gameforge} hash tag puts every error key in one cluster slot,
+# so the tracking pipelines and the stats MGET never span shards (trading even key
+# distribution for slot locality: all writers hit the same counters and index anyway)
+_KEY_TAG = "{gameforge}"
+_HOUR_KEY_PREFIX = f"errors:hour:{_KEY_TAG}:"
+_HOUR_INDEX_PREFIX = f"errors:index:hour:{_KEY_TAG}:"
+_DAY_KEY_PREFIX = f"errors:day:{_KEY_TAG}:"
+
+# Full error records are appended to one capped stream instead of a hash per error
+ERROR_STREAM_KEY = f"errors:stream:{_KEY_TAG}"
+ERROR_STREAM_MAXLEN = 100000  # Approximate cap (MAXLEN ~), trimmed by Redis on XADD
+ERROR_STATS_SAMPLE = 10000  # Most recent records read by get_error_stats for severities
+
+# [minute, hour bucket, day bucket] for the current minute, so track_error does not
+# call strftime for every error
+_time_buckets = [-1, "", ""]
+
+
+def _current_time_buckets() -> Tuple[str, str]:
+    """Current hour ('%Y-%m-%d:%H') and day ('%Y-%m-%d') key buckets, recomputed once a minute"""
+    minute = int(time.time()) // 60
+    if minute != _time_buckets[0]:
+        now = datetime.now()
+        _time_buckets[:] = [minute, now.strftime('%Y-%m-%d:%H'), now.strftime('%Y-%m-%d')]
+    return _time_buckets[1], _time_buckets[2]
+
+
 class ErrorAggregator:
     """Aggregate and analyze error patterns"""
     
@@ -71,29 +165,40 @@ class ErrorAggregator:
         
     async def track_error(self, error_context: ErrorContext):
         """Track error for pattern analysis"""
-        # Create error pattern key
-        pattern_key = f"{error_context.category.value}:{error_context.exception_type}"
+        pipe = self.redis.pipeline()
+        self.add_tracking(pipe, error_context)
+        results = await pipe.execute()
+        
+        # Check for error spikes
+        self._check_error_spikes(self._pattern_key(error_context), results[0])
+    
+    @staticmethod
+    def _pattern_key(error_context: ErrorContext) -> str:
+        """Error pattern key: category plus exception type"""
+        return f"{error_context.category.value}:{error_context.exception_type}"
+    
+    def add_tracking(self, pipe, error_context: ErrorContext):
+        """Queue the tracking writes on a pipeline; the hourly INCR is queued first"""
+        pattern_key = self._pattern_key(error_context)
         
         # Track in Redis with time window
-        hour_key = f"errors:hour:{datetime.now().strftime('%Y-%m-%d:%H')}:{pattern_key}"
-        day_key = f"errors:day:{datetime.now().strftime('%Y-%m-%d')}:{pattern_key}"
+        hour, day = _current_time_buckets()
+        hour_key = f"{_HOUR_KEY_PREFIX}{hour}:{pattern_key}"
+        index_key = f"{_HOUR_INDEX_PREFIX}{hour}"
+        day_key = f"{_DAY_KEY_PREFIX}{day}:{pattern_key}"
         
-        pipe = self.redis.pipeline()
         pipe.incr(hour_key)
         pipe.expire(hour_key, 3600)  # 1 hour TTL
+        # Index of the patterns seen this hour, so stats never need to SCAN
+        pipe.sadd(index_key, pattern_key)
+        pipe.expire(index_key, 3600)
         pipe.incr(day_key)
         pipe.expire(day_key, 86400)  # 24 hour TTL
-        await pipe.execute()
-        
-        # Check for error spikes
-        await self._check_error_spikes(pattern_key)
     
-    async def _check_error_spikes(self, pattern_key: str):
-        """Check for unusual error spikes"""
-        hour_key = f"errors:hour:{datetime.now().strftime('%Y-%m-%d:%H')}:{pattern_key}"
-        count = await self.redis.get(hour_key)
-        
-        if count and int(count) > 10:  # More than 10 errors of same type per hour
+    @staticmethod
+    def _check_error_spikes(pattern_key: str, count: int):
+        """Check for unusual error spikes, given the hourly count the INCR returned (no Redis call)"""
+        if count > ERROR_SPIKE_THRESHOLD:
             logger.warning(f"🚨 Error spike detected: {pattern_key} - {count} occurrences this hour")
     
     async def get_error_stats(self, hours: int = 24) -> Dict[str, Any]:
@@ -105,21 +210,46 @@ class ErrorAggregator:
             "top_errors": []
         }
         
-        # Get all error keys for the time period
-        pattern = f"errors:hour:*"
-        error_counts = {}
+        # Read the pattern index of every hour in the period, plus the latest stored
+        # records of the period (stream IDs are millisecond timestamps), in one round trip
+        now = datetime.now()
+        hour_buckets = [(now - timedelta(hours=h)).strftime('%Y-%m-%d:%H') for h in range(hours)]
+        since_ms = int((now - timedelta(hours=hours)).timestamp() * 1000)
         
-        async for key in self.redis.scan_iter(match=pattern):
-            count = await self.redis.get(key)
-            if count:
-                # Parse the key to extract pattern
-                parts = key.split(":", 3)
-                if len(parts) == 4:
-                    pattern_key = parts[3]
+        pipe = self.redis.pipeline()
+        for hour in hour_buckets:
+            pipe.smembers(f"{_HOUR_INDEX_PREFIX}{hour}")
+        pipe.xrevrange(ERROR_STREAM_KEY, min=str(since_ms), count=ERROR_STATS_SAMPLE)
+        *indexed, records = await pipe.execute()
+        
+        hour_keys = []
+        pattern_keys = []
+        for hour, members in zip(hour_buckets, indexed):
+            for member in members:
+                pattern_key = member.decode() if isinstance(member, bytes) else member
+                hour_keys.append(f"{_HOUR_KEY_PREFIX}{hour}:{pattern_key}")
+                pattern_keys.append(pattern_key)
+        
+        # Then fetch all their counters in a second one
+        error_counts = {}
+        if hour_keys:
+            counts = await self.redis.mget(hour_keys)
+            for pattern_key, count in zip(pattern_keys, counts):
+                if count:
                     error_counts[pattern_key] = error_counts.get(pattern_key, 0) + int(count)
         
         # Aggregate statistics
         stats["total_errors"] = sum(error_counts.values())
+        for pattern_key, count in error_counts.items():
+            category = pattern_key.split(":", 1)[0]
+            stats["by_category"][category] = stats["by_category"].get(category, 0) + count
+        
+        # Severities are only in the stored records (a sample: rate-limited errors are not stored)
+        for _, fields in records:
+            severity = fields.get(b"severity") or fields.get("severity")
+            if isinstance(severity, bytes):
+                severity = severity.decode()
+            stats["by_severity"][severity] = stats["by_severity"].get(severity, 0) + 1
         
         # Top errors
         sorted_errors = sorted(error_counts.items(), key=lambda x: x[1], reverse=True)
@@ -128,30 +258,76 @@ class ErrorAggregator:
         return stats
 
 
+# Records from every EnhancedLogger go through this queue; a single listener thread does
+# the console and file writes so logging calls never block on I/O
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_listener: Optional[QueueListener] = None
+
+
+def _start_log_listener():
+    """Start the listener thread that owns the real handlers (once per process)"""
+    global _log_listener
+    if _log_listener is not None:
+        return
+    
+    # Setup structured logging format
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s - '
+        '[%(filename)s:%(lineno)d] - %(funcName)s()'
+    )
+    
+    # Console handler
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+    
+    # File handler for errors
+    file_handler = logging.FileHandler('gameforge_errors.log')
+    file_handler.setLevel(logging.ERROR)
+    file_handler.setFormatter(formatter)
+    
+    _log_listener = QueueListener(_log_queue, console_handler, file_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)  # Flushes whatever is still queued
+
+
 class EnhancedLogger:
-    """Enhanced logger with structured logging"""
+    """Enhanced logger with structured logging
+    
+    Redis writes are queued and flushed by a background task in pipelined
+    batches (up to batch_size errors or flush_interval_ms), so log_error
+    never waits on Redis. When the queue is full, errors are still logged
+    locally but not stored; dropped_errors counts them.
     
-    def __init__(self, name: str, redis_client: Optional[redis.Redis] = None):
+    Each error pattern (category plus exception type) may store up to
+    store_rate full records per second, with bursts of store_burst. Beyond
+    that, errors are only counted in the hourly/daily stats, without a
+    stack trace or stored context; rate_limited_errors counts them.
+    """
+    
+    def __init__(self, name: str, redis_client: Optional[redis.Redis] = None,
+                 batch_size: int = 128, flush_interval_ms: int = 50, max_queue_size: int = 10000,
+                 store_rate: float = 10.0, store_burst: int = 20):
         self.logger = logging.getLogger(name)
         self.redis = redis_client
         self.error_aggregator = ErrorAggregator(redis_client) if redis_client else None
         
-        # Setup structured logging format
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s - '
-            '[%(filename)s:%(lineno)d] - %(funcName)s()'
-        )
+        # Background Redis writer (started on first use, when a loop is running)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._flusher_task: Optional[asyncio.Task] = None
+        self.dropped_errors = 0
         
-        # Console handler
-        console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setFormatter(formatter)
-        self.logger.addHandler(console_handler)
+        # Token bucket per error pattern: pattern -> [tokens, last refill (monotonic)]
+        self.store_rate = store_rate
+        self.store_burst = store_burst
+        self._buckets: Dict[str, List[float]] = {}
+        self.rate_limited_errors = 0
         
-        # File handler for errors
-        file_handler = logging.FileHandler('gameforge_errors.log')
-        file_handler.setLevel(logging.ERROR)
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
+        # Console and error-file output via the shared queue listener
+        _start_log_listener()
+        if not any(isinstance(handler, QueueHandler) for handler in self.logger.handlers):
+            self.logger.addHandler(QueueHandler(_log_queue))
         
         self.logger.setLevel(logging.INFO)
     
@@ -164,6 +340,7 @@ class EnhancedLogger:
                        endpoint: Optional[str] = None,
                        metadata: Optional[Dict[str, Any]] = None):
         """Log error with enhanced context"""
+        store = self._take_store_token(f"{_CAT_STR[category]}:{type(error).__name__}")
         
         error_context = ErrorContext(
             error_id=str(uuid.uuid4()),
@@ -172,7 +349,7 @@ class EnhancedLogger:
             category=category,
             message=str(error),
             exception_type=type(error).__name__,
-            stack_trace=traceback.format_exc(),
+            stack_trace=self._format_stack_trace(error, severity) if store else "",
             user_id=user_id,
             request_id=request_id,
             endpoint=endpoint,
@@ -191,42 +368,146 @@ class EnhancedLogger:
         else:
             self.logger.info(log_message)
         
-        # Store in Redis for analysis
+        # Store in Redis for analysis and track patterns (batched by the flusher)
         if self.redis:
-            await self._store_error_context(error_context)
-            
-        # Track patterns
-        if self.error_aggregator:
-            await self.error_aggregator.track_error(error_context)
+            if self._flusher_task is None:
+                self._flusher_task = asyncio.create_task(self._flusher())
+            try:
+                self._queue.put_nowait((error_context, store))
+            except asyncio.QueueFull:
+                self.dropped_errors += 1
+    
+    def _take_store_token(self, pattern_key: str) -> bool:
+        """Whether an error of this pattern may be stored in full (token bucket per pattern)"""
+        now = time.monotonic()
+        bucket = self._buckets.get(pattern_key)
+        if bucket is None:
+            self._buckets[pattern_key] = [self.store_burst - 1, now]
+            return True
+        
+        tokens = min(self.store_burst, bucket[0] + (now - bucket[1]) * self.store_rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            self.rate_limited_errors += 1
+            return False
+        bucket[0] = tokens - 1
+        return True
+    
+    @staticmethod
+    def _format_stack_trace(error: Exception, severity: ErrorSeverity) -> str:
+        """Stack trace of the error itself, only for HIGH and CRITICAL errors
+        
+        Formatting walks every frame, so lower severities skip it; using the
+        error's own __traceback__ (not format_exc) also works outside except blocks.
+        """
+        if severity not in (ErrorSeverity.HIGH, ErrorSeverity.CRITICAL) or error.__traceback__ is None:
+            return ""
+        return "".join(traceback.format_exception(type(error), error, error.__traceback__))
     
     def _format_error_message(self, context: ErrorContext) -> str:
         """Format error message with context"""
-        parts = [
-            f"[{context.error_id}]",
-            f"[{context.severity.value.upper()}]",
-            f"[{context.category.value}]",
-            context.message
-        ]
-        
-        if context.user_id:
-            parts.append(f"user:{context.user_id}")
-        if context.request_id:
-            parts.append(f"request:{context.request_id}")
-        if context.endpoint:
-            parts.append(f"endpoint:{context.endpoint}")
+        message = (
+            f"[{context.error_id}] - [{_SEV_UPPER[context.severity]}] - "
+            f"[{_CAT_STR[context.category]}] - {context.message}"
+        )
+        
+        if context.user_id or context.request_id or context.endpoint:
+            suffix = tuple(
+                f"{label}:{value}"
+                for label, value in (
+                    ("user", context.user_id),
+                    ("request", context.request_id),
+                    ("endpoint", context.endpoint)
+                )
+                if value
+            )
+            message = f"{message} - {' - '.join(suffix)}"
             
-        return " - ".join(parts)
+        return message
     
-    async def _store_error_context(self, context: ErrorContext):
-        """Store error context in Redis"""
-        error_key = f"error:{context.error_id}"
-        await self.redis.hset(error_key, mapping={
-            "data": json.dumps(asdict(context), default=str),
+    async def _flusher(self):
+        """Drain queued errors and write each batch in one pipeline
+        
+        Serializing a batch into its pipeline is CPU work and sending it is I/O, so the
+        next batch is gathered and serialized while the previous one is still in flight
+        (at most one send at a time).
+        """
+        loop = asyncio.get_running_loop()
+        in_flight: Optional[asyncio.Task] = None
+        
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                pipe, incr_positions = self._build_pipeline(batch)
+            except Exception as e:
+                self.logger.error(f"Failed to serialize {len(batch)} errors for Redis: {e}")
+                for _ in batch:
+                    self._queue.task_done()
+                continue
+            
+            if in_flight is not None:
+                await in_flight
+            in_flight = asyncio.create_task(self._send(pipe, batch, incr_positions))
+    
+    def _build_pipeline(self, batch: List[Tuple[ErrorContext, bool]]) -> Tuple[Any, List[int]]:
+        """Queue the storage and tracking writes of a batch; returns the pipeline and hourly INCR positions
+        
+        Rate-limited errors (store False) are only tracked, not stored.
+        """
+        pipe = self.redis.pipeline()
+        incr_positions = []
+        for context, store in batch:
+            incr_positions.append(len(pipe))  # add_tracking queues the hourly INCR first
+            self.error_aggregator.add_tracking(pipe, context)
+            if store:
+                self._add_error_context(pipe, context)
+        return pipe, incr_positions
+    
+    async def _send(self, pipe, batch: List[Tuple[ErrorContext, bool]], incr_positions: List[int]):
+        """Execute a batch's pipeline in one round trip and check the returned counts for spikes"""
+        try:
+            results = await pipe.execute()
+            for (context, _), position in zip(batch, incr_positions):
+                self.error_aggregator._check_error_spikes(
+                    self.error_aggregator._pattern_key(context), results[position]
+                )
+        except Exception as e:
+            self.logger.error(f"Failed to store {len(batch)} errors in Redis: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+    
+    async def close(self):
+        """Write out everything still queued, then stop the flusher"""
+        if self._flusher_task is None:
+            return
+        await self._queue.join()
+        self._flusher_task.cancel()
+        await asyncio.gather(self._flusher_task, return_exceptions=True)
+        self._flusher_task = None
+    
+    def _add_error_context(self, pipe, context: ErrorContext):
+        """Queue the error context append to the capped error stream on a pipeline"""
+        pipe.xadd(ERROR_STREAM_KEY, {
+            "error_id": context.error_id,
+            # The fields are flat (no nested dataclasses), so asdict's deep copy is not needed
+            "data": _dumps(context.__dict__),
             "severity": context.severity.value,
             "category": context.category.value,
             "timestamp": context.timestamp.isoformat()
-        })
-        await self.redis.expire(error_key, 604800)  # 7 days TTL
+        }, maxlen=ERROR_STREAM_MAXLEN, approximate=True)
 
 
 class ErrorHandler:
@@ -235,7 +516,12 @@ class ErrorHandler:
     def __init__(self, redis_client: Optional[redis.Redis] = None):
         self.enhanced_logger = EnhancedLogger("GameForgeErrorHandler", redis_client)
         self.recovery_strategies: Dict[ErrorCategory, Callable] = {}
-        self.circuit_breakers: Dict[str, Dict] = {}
+        # Event loop that errors raised on other threads are handed to
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # Circuit breaker state per ErrorCategory (see _CATEGORY_INDEX): fixed size, no dict churn
+        self._breaker_failures = array.array('i', [0] * len(ErrorCategory))
+        self._breaker_last_failure = array.array('d', [0.0] * len(ErrorCategory))
         
         # Register default recovery strategies
         self._register_default_strategies()
@@ -275,7 +561,7 @@ class ErrorHandler:
         )
         
         # Check circuit breaker
-        if self._is_circuit_open(category.value):
+        if self._is_circuit_open(category):
             self.enhanced_logger.logger.warning(f"🔐 Circuit breaker open for {category.value}")
             return False
         
@@ -287,7 +573,7 @@ class ErrorHandler:
                 if recovery_successful:
                     self.enhanced_logger.logger.info(f"🔧 Recovery successful for {category.value}")
                 else:
-                    self._increment_circuit_breaker(category.value)
+                    self._increment_circuit_breaker(category)
             except Exception as recovery_error:
                 await self.enhanced_logger.log_error(
                     error=recovery_error,
@@ -295,16 +581,22 @@ class ErrorHandler:
                     category=ErrorCategory.SYSTEM,
                     metadata={"original_error": str(error), "recovery_attempt": True}
                 )
-                self._increment_circuit_breaker(category.value)
+                self._increment_circuit_breaker(category)
         
         return recovery_successful
     
+    async def shutdown(self):
+        """Flush queued error writes"""
+        await self.enhanced_logger.close()
+    
     async def _handle_gpu_memory_error(self, error: Exception, context: Optional[Dict]) -> bool:
         """Handle GPU memory errors"""
+        torch = _get_torch()
+        if torch is None:
+            self.enhanced_logger.logger.error("Failed to clean GPU memory: torch is not installed")
+            return False
+        
         try:
-            import torch
-            import gc
-            
             # Force GPU memory cleanup
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
@@ -337,103 +629,170 @@ class ErrorHandler:
         await asyncio.sleep(1)  # Brief delay
         return True  # Suggest retry
     
-    def _is_circuit_open(self, service: str) -> bool:
-        """Check if circuit breaker is open for a service"""
-        if service not in self.circuit_breakers:
-            return False
-        
-        breaker = self.circuit_breakers[service]
-        now = time.time()
+    def _is_circuit_open(self, category: ErrorCategory) -> bool:
+        """Check if circuit breaker is open for a category"""
+        i = _CATEGORY_INDEX[category]
         
         # Reset if enough time has passed
-        if now - breaker["last_failure"] > breaker.get("reset_timeout", 300):  # 5 minutes
-            self.circuit_breakers[service] = {"failures": 0, "last_failure": 0}
+        if time.time() - self._breaker_last_failure[i] > CIRCUIT_BREAKER_RESET_SECONDS:
+            self._breaker_failures[i] = 0
             return False
         
-        return breaker["failures"] >= breaker.get("threshold", 5)
+        return self._breaker_failures[i] >= CIRCUIT_BREAKER_THRESHOLD
     
-    def _increment_circuit_breaker(self, service: str):
+    def _increment_circuit_breaker(self, category: ErrorCategory):
         """Increment circuit breaker failure count"""
-        if service not in self.circuit_breakers:
-            self.circuit_breakers[service] = {"failures": 0, "last_failure": 0}
+        i = _CATEGORY_INDEX[category]
+        self._breaker_failures[i] += 1
+        self._breaker_last_failure[i] = time.time()
         
-        self.circuit_breakers[service]["failures"] += 1
-        self.circuit_breakers[service]["last_failure"] = time.time()
-        
-        if self.circuit_breakers[service]["failures"] >= 5:
-            self.enhanced_logger.logger.warning(f"🔐 Circuit breaker opened for {service}")
+        if self._breaker_failures[i] >= CIRCUIT_BREAKER_THRESHOLD:
+            self.enhanced_logger.logger.warning(f"🔐 Circuit breaker opened for {category.value}")
 
 
 # Global error handler instance
 global_error_handler: Optional[ErrorHandler] = None
 
+# Cap on unhandled exceptions being reported at once, so an exception storm cannot
+# flood the event loop with error-handling tasks
+_excepthook_slots = threading.BoundedSemaphore(64)
+
+# Error reports scheduled by sync error_boundary wrappers; the loop only keeps weak
+# references to tasks, so these hold them until they finish
+_report_tasks: set = set()
 
-def initialize_error_handling(redis_client: Optional[redis.Redis] = None):
-    """Initialize global error handling"""
+
+def initialize_error_handling(redis_client: Optional[redis.Redis] = None,
+                              loop: Optional[asyncio.AbstractEventLoop] = None):
+    """Initialize global error handling
+    
+    Unhandled exceptions are reported on `loop` (default: the running loop), whichever
+    thread raised them.
+    """
     global global_error_handler
     global_error_handler = ErrorHandler(redis_client)
     
+    if loop is None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+    global_error_handler.loop = loop
+    
     # Set up global exception handler
     def handle_exception(exc_type, exc_value, exc_traceback):
+        # Always print the traceback first: the report below is best effort, and the
+        # process may exit before the loop gets to it
+        sys.__excepthook__(exc_type, exc_value, exc_traceback)
         if issubclass(exc_type, KeyboardInterrupt):
-            sys.__excepthook__(exc_type, exc_value, exc_traceback)
+            return
+        
+        handler_loop = global_error_handler.loop
+        if handler_loop is None or not handler_loop.is_running() or not _excepthook_slots.acquire(blocking=False):
+            # Nowhere to report it (or too many in flight); a stopped loop would never
+            # run the report and release its slot
             return
         
         # Log unhandled exceptions
-        asyncio.create_task(global_error_handler.handle_error(
+        coro = global_error_handler.handle_error(
             error=exc_value,
             category=ErrorCategory.SYSTEM,
             severity=ErrorSeverity.CRITICAL,
             should_retry=False
-        ))
+        )
+        try:
+            future = asyncio.run_coroutine_threadsafe(coro, handler_loop)
+        except RuntimeError:
+            # The loop closed after the is_running() check
+            coro.close()
+            _excepthook_slots.release()
+            return
+        future.add_done_callback(lambda _: _excepthook_slots.release())
     
     sys.excepthook = handle_exception
+    return global_error_handler
+
+
+def _boundary_context(func: Callable, args: tuple, kwargs: dict) -> Dict[str, Any]:
+    """Error context recorded by error_boundary for a failed call"""
+    return {
+        "function": func.__name__,
+        "args": _ARGS_REPR.repr(args),
+        "kwargs": _ARGS_REPR.repr(kwargs)
+    }
 
 
 def error_boundary(category: ErrorCategory = ErrorCategory.UNKNOWN,
                    severity: ErrorSeverity = ErrorSeverity.MEDIUM,
                    should_retry: bool = True,
                    fallback_return=None):
-    """Decorator for error boundary with automatic handling"""
+    """Decorator for error boundary with automatic handling
+    
+    The wrapper is specialized at decoration time: async functions get the
+    retry path only when should_retry is set, so no per-call option checks remain.
+    """
+    has_fallback = fallback_return is not None
     
     def decorator(func):
-        @wraps(func)
-        async def async_wrapper(*args, **kwargs):
-            try:
-                return await func(*args, **kwargs)
-            except Exception as e:
-                if global_error_handler:
-                    context = {
-                        "function": func.__name__,
-                        "args": str(args)[:200],  # Truncate long args
-                        "kwargs": str(kwargs)[:200]
-                    }
+        # Decide once at decoration time and build only the wrapper that is used
+        if asyncio.iscoroutinefunction(func) and should_retry:
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    handler = global_error_handler
+                    if handler:
+                        context = _boundary_context(func, args, kwargs)
+                        
+                        if await handler.handle_error(
+                            error=e,
+                            category=category,
+                            severity=severity,
+                            context=context,
+                            should_retry=True
+                        ):
+                            # Retry the operation once
+                            try:
+                                return await func(*args, **kwargs)
+                            except Exception as retry_error:
+                                await handler.handle_error(
+                                    error=retry_error,
+                                    category=category,
+                                    severity=ErrorSeverity.HIGH,
+                                    context={**context, "retry_attempt": True},
+                                    should_retry=False
+                                )
                     
-                    handled = await global_error_handler.handle_error(
-                        error=e,
-                        category=category,
-                        severity=severity,
-                        context=context,
-                        should_retry=should_retry
-                    )
+                    # Return fallback or re-raise
+                    if has_fallback:
+                        return fallback_return
+                    raise
+            
+            return async_wrapper
+        
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    handler = global_error_handler
+                    if handler:
+                        await handler.handle_error(
+                            error=e,
+                            category=category,
+                            severity=severity,
+                            context=_boundary_context(func, args, kwargs),
+                            should_retry=False
+                        )
                     
-                    if handled and should_retry:
-                        # Retry the operation once
-                        try:
-                            return await func(*args, **kwargs)
-                        except Exception as retry_error:
-                            await global_error_handler.handle_error(
-                                error=retry_error,
-                                category=category,
-                                severity=ErrorSeverity.HIGH,
-                                context={**context, "retry_attempt": True},
-                                should_retry=False
-                            )
-                
-                # Return fallback or re-raise
-                if fallback_return is not None:
-                    return fallback_return
-                raise
+                    # Return fallback or re-raise
+                    if has_fallback:
+                        return fallback_return
+                    raise
+            
+            return async_wrapper
         
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
@@ -441,32 +800,30 @@ def error_boundary(category: ErrorCategory = ErrorCategory.UNKNOWN,
                 return func(*args, **kwargs)
             except Exception as e:
                 # For sync functions, just log and re-raise
-                if global_error_handler:
-                    context = {
-                        "function": func.__name__,
-                        "args": str(args)[:200],
-                        "kwargs": str(kwargs)[:200]
-                    }
-                    
-                    # Use asyncio to run the async error handler
+                handler = global_error_handler
+                if handler:
+                    # Hand the async error handler to the running loop, if any
                     try:
-                        loop = asyncio.get_event_loop()
-                        loop.create_task(global_error_handler.handle_error(
+                        loop = asyncio.get_running_loop()
+                    except RuntimeError:
+                        # No event loop, just log normally
+                        logging.error(f"Error in {func.__name__}: {e}")
+                    else:
+                        task = loop.create_task(handler.handle_error(
                             error=e,
                             category=category,
                             severity=severity,
-                            context=context,
+                            context=_boundary_context(func, args, kwargs),
                             should_retry=False
                         ))
-                    except RuntimeError:
-                        # No event loop, just log normally
-                        logging.error(f"Error in {func.__name__}: {e}")
+                        _report_tasks.add(task)
+                        task.add_done_callback(_report_tasks.discard)
                 
-                if fallback_return is not None:
+                if has_fallback:
                     return fallback_return
                 raise
         
-        return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
+        return sync_wrapper
     
     return decorator
 
@@ -79,8 +79,7 @@ class Phase1Integration:
     async def _initialize_error_handling(self):
         """Initialize centralized error handling"""
         logger.info("🔧 Initializing error handling system...")
-        initialize_error_handling(self.redis_client)
-        self.error_handler = global_error_handler
+        self.error_handler = initialize_error_handling(self.redis_client)
         logger.info("✅ Error handling system initialized")
     
     async def _initialize_migrations(self):
@@ -271,6 +270,11 @@ class Phase1Integration:
                 await self.ai_pipeline.shutdown()
                 logger.info("✅ AI Pipeline shutdown complete")
             
+            # Flush queued error writes while Redis is still open
+            if self.error_handler:
+                await self.error_handler.shutdown()
+                logger.info("✅ Error handler shutdown complete")
+            
             # Close Redis connection
             if self.redis_client:
                 await self.redis_client.close()
@@ -506,20 +506,36 @@ class EnhancedQueueManager:
         """Clean up expired jobs"""
         cutoff = datetime.now() - timedelta(hours=24)
         
-        # Find expired jobs
+        # Find expired jobs (a large COUNT hint means far fewer SCAN round trips than the default 10)
         pattern = "job:*"
-        async for key in self.redis.scan_iter(match=pattern):
-            job_data = await self.redis.hget(key, "data")
-            if job_data:
+        keys = []
+        async for key in self.redis.scan_iter(match=pattern, count=1000):
+            keys.append(key.decode() if isinstance(key, bytes) else key)
+        
+        # Fetch the job payloads in pipelined batches instead of one HGET per key
+        expired = []
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            pipe = self.redis.pipeline(transaction=False)
+            for key in batch:
+                pipe.hget(key, "data")
+            # job:*:result keys are not hashes; their HGET error comes back as a value
+            payloads = await pipe.execute(raise_on_error=False)
+            
+            for key, job_data in zip(batch, payloads):
+                if not job_data or isinstance(job_data, Exception):
+                    continue
                 try:
                     data = json.loads(job_data)
                     created_at = datetime.fromisoformat(data["created_at"])
                     if created_at < cutoff:
-                        await self.redis.delete(key)
-                        await self.redis.delete(f"{key}:result")
+                        expired.extend([key, f"{key}:result"])
                 except (json.JSONDecodeError, ValueError, KeyError):
                     # Invalid job data, delete it
-                    await self.redis.delete(key)
+                    expired.append(key)
+        
+        for start in range(0, len(expired), 1000):
+            await self.redis.delete(*expired[start:start + 1000])
     
     async def shutdown(self):
         """Shutdown queue manager"""